@@ -0,0 +1,176 @@
+# Joe Shymanski
+# Sudoku Solver - benchmark harness
+import io
+import json
+import math
+import platform
+import random
+import sys
+import time
+import contextlib
+import SudokuIO
+import SudokuGenerator
+from SudokuSolver import Table
+
+TECHNIQUES = ["propagate", "findNakedSingles", "findHiddenSingles", "findNakedPairs", "findHiddenPairs",
+              "findPointingPairs", "findNakedTriples", "findXWings", "findBoxLineReductions", "findHiddenTriples",
+              "findNakedQuads", "findHiddenQuads", "findSwordfish", "findXYWings", "findJellyfish", "bruteForceSolve"]
+
+# Clue targets of the generated tiers; a puzzle keeps more clues if no further one can be removed uniquely.
+GENERATED_TIERS = {
+    "easy": 36,
+    "medium": 30,
+    "hard": 24,
+}
+
+# Known puzzles with the minimum of 17 clues and a unique solution.
+SEVENTEEN_CLUE = [
+    "000000010400000000020000000000050407008000300001090000300400200050100000000806000",
+    "000000010400000000020000000000050604008000300001090000300400200050100000000807000",
+    "000000012000035000000600070700000300000400800100000000000120000080000040050000600",
+    "000000012003600000000007000410020000000500300700000600280000040000300500000000000",
+    "000000012008030000000000040120500000000004700060000000507000300000620000000100000",
+    "000000012040050000000009000070600400000100000000000050000087500601000300200000000",
+    "000000012050400000000000030700600400001000000000080000920000800000510700000003000",
+    "000000013000030080070000000000206000030000900000010000600500204000400700100000000",
+    "000000013000200000000000080000760200008000400010000000200000750600340000000008000",
+]
+
+
+def randomSolution(rng):
+    # A shuffled copy of a fixed valid grid: digits relabeled, bands/stacks and the lines inside them reordered.
+    order = []
+    for band in rng.sample(range(3), 3):
+        order.extend(band * 3 + line for line in rng.sample(range(3), 3))
+    cols = []
+    for stack in rng.sample(range(3), 3):
+        cols.extend(stack * 3 + line for line in rng.sample(range(3), 3))
+    digits = rng.sample(range(1, 10), 9)
+    return [digits[(row * 3 + row // 3 + col) % 9] for row in order for col in cols]
+
+
+def generatePuzzle(rng, clues):
+    values = SudokuGenerator.removeClues(randomSolution(rng), rng.sample(range(81), 81), clues)
+    return "".join(str(value) if value else "." for value in values)
+
+
+def buildCorpus(count=50, seed=0, tablePath="SudokuTable.txt"):
+    rng = random.Random(seed)
+    corpus = {"table": list(SudokuIO.readPuzzles(tablePath))}
+    for tier, clues in GENERATED_TIERS.items():
+        corpus[tier] = [generatePuzzle(rng, clues) for _ in range(count)]
+    corpus["17-clue"] = [puzzle.replace("0", ".") for puzzle in SEVENTEEN_CLUE]
+    return corpus
+
+
+def instrument(table, techniqueTimes):
+    # deductiveSolve looks its techniques up on the instance, so timed wrappers can shadow the methods.
+    for name in TECHNIQUES:
+        method = getattr(table, name)
+
+        def timed(*args, method=method, name=name, **kwargs):
+            start = time.perf_counter_ns()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                techniqueTimes[name] += time.perf_counter_ns() - start
+        setattr(table, name, timed)
+
+
+def percentile(sortedValues, fraction):
+    if not sortedValues:
+        return 0
+    rank = max(0, min(len(sortedValues) - 1, math.ceil(fraction * len(sortedValues)) - 1))
+    return sortedValues[rank]
+
+
+def benchmarkTier(puzzles, engine="deductive", repeat=1):
+    latencies = []
+    techniqueTimes = dict.fromkeys(TECHNIQUES, 0)
+    solved = 0
+    sink = io.StringIO()
+    for _ in range(repeat):
+        for puzzle in puzzles:
+            table = Table.fromString(puzzle)
+            instrument(table, techniqueTimes)
+            with contextlib.redirect_stdout(sink):
+                start = time.perf_counter_ns()
+                if engine == "deductive":
+                    table.deductiveSolve(False)
+                else:
+                    table.bruteForceSolve(False, engine=engine)
+                latencies.append(time.perf_counter_ns() - start)
+            sink.seek(0)
+            sink.truncate()
+            solved += 0 not in table.values
+    latencies.sort()
+    total = sum(latencies)
+    return {
+        "puzzles": len(latencies),
+        "solved": solved,
+        "puzzlesPerSec": len(latencies) / (total / 1e9) if total else 0.0,
+        "meanMs": total / len(latencies) / 1e6 if latencies else 0.0,
+        "p50Ms": percentile(latencies, 0.50) / 1e6,
+        "p95Ms": percentile(latencies, 0.95) / 1e6,
+        "p99Ms": percentile(latencies, 0.99) / 1e6,
+        "techniqueMs": {name: ns / 1e6 for name, ns in techniqueTimes.items() if ns},
+    }
+
+
+def runBenchmark(count=50, seed=0, engine="deductive", repeat=1, tiers=None, tablePath="SudokuTable.txt"):
+    corpus = buildCorpus(count, seed, tablePath)
+    results = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "engine": engine,
+        "seed": seed,
+        "count": count,
+        "repeat": repeat,
+        "tiers": {},
+    }
+    for tier, puzzles in corpus.items():
+        if tiers is None or tier in tiers:
+            results["tiers"][tier] = benchmarkTier(puzzles, engine, repeat)
+    return results
+
+
+def printReport(results, baseline=None):
+    print("Engine", results["engine"])
+    for tier, stats in results["tiers"].items():
+        line = "%-8s %5d puzzles %9.1f puzzles/sec  p50 %8.3f ms  p95 %8.3f ms  p99 %8.3f ms" % (
+            tier, stats["puzzles"], stats["puzzlesPerSec"], stats["p50Ms"], stats["p95Ms"], stats["p99Ms"])
+        if baseline and tier in baseline["tiers"] and baseline["tiers"][tier]["puzzlesPerSec"]:
+            line += "  %+.1f%% vs baseline" % (
+                100 * (stats["puzzlesPerSec"] / baseline["tiers"][tier]["puzzlesPerSec"] - 1))
+        print(line)
+        for name, ms in sorted(stats["techniqueMs"].items(), key=lambda item: -item[1]):
+            print("    %-20s %10.3f ms" % (name, ms))
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Sudoku Solver benchmark")
+    parser.add_argument("--count", type=int, default=50, help="puzzles per generated tier")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the generated tiers")
+    parser.add_argument("--engine", default="deductive", help="deductive, or a bruteForceSolve engine such as dlx")
+    parser.add_argument("--repeat", type=int, default=1, help="times to solve each tier")
+    parser.add_argument("--tiers", nargs="*", help="only run these tiers")
+    parser.add_argument("--table", default="SudokuTable.txt", help="puzzle file for the table tier")
+    parser.add_argument("--out", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare against")
+    args = parser.parse_args(argv)
+    results = runBenchmark(args.count, args.seed, args.engine, args.repeat, args.tiers, args.table)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+    printReport(results, baseline)
+    if args.out:
+        with open(args.out, "w") as file:
+            json.dump(results, file, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,178 @@
+# Joe Shymanski
+# Sudoku Solver - solution cache keyed by a canonical form of the puzzle
+# Puzzles that differ only by transposition, reordering of bands/stacks or of the lines inside them, or relabeling of
+# the digits share a canonical form. The cache stores the solution of the canonical puzzle and maps it back through
+# the inverse transformation on a hit.
+import itertools
+from collections import OrderedDict
+
+# Orderings tried per orientation when lines tie on their invariants; beyond this, ties fall back to input order.
+# A fallback can only cost a cache hit, never give a wrong answer, since every key is an exact transformed puzzle.
+MAX_ORDERINGS = 64
+
+
+def lineKeys(grid, transposed):
+    # Invariant of each row (of the transposed grid if asked): its clue count and its sorted clue counts per stack.
+    keys = []
+    for row in range(9):
+        segments = []
+        for stack in range(3):
+            count = 0
+            for col in range(stack * 3, stack * 3 + 3):
+                if (grid[col * 9 + row] if transposed else grid[row * 9 + col]) != "0":
+                    count += 1
+            segments.append(count)
+        keys.append((sum(segments), tuple(sorted(segments, reverse=True))))
+    return keys
+
+
+def tiedOrderings(keys):
+    # All line orders that sort bands, then the lines inside each band, by descending key, permuting within ties.
+    bandKeys = [tuple(sorted(keys[band * 3:band * 3 + 3], reverse=True)) for band in range(3)]
+    bandGroups = groupTies(range(3), bandKeys)
+    lineGroups = [groupTies(range(band * 3, band * 3 + 3), keys) for band in range(3)]
+    for bandOrder in expandTies(bandGroups):
+        for lineOrders in itertools.product(*(list(expandTies(lineGroups[band])) for band in bandOrder)):
+            yield [line for lines in lineOrders for line in lines]
+
+
+def groupTies(items, keys):
+    ordered = sorted(items, key=lambda item: keys[item], reverse=True)
+    return [list(group) for _, group in itertools.groupby(ordered, key=lambda item: keys[item])]
+
+
+def expandTies(groups):
+    for parts in itertools.product(*(itertools.permutations(group) for group in groups)):
+        yield [item for part in parts for item in part]
+
+
+def limitedOrderings(keys):
+    orderings = []
+    for ordering in tiedOrderings(keys):
+        orderings.append(ordering)
+        if len(orderings) > MAX_ORDERINGS:
+            return orderings[:1]
+    return orderings
+
+
+def relabeled(grid, transposed, rowOrder, colOrder):
+    # Applies the line orders and renames digits by first appearance; returns the string and the digit map.
+    labels = {"0": "0"}
+    out = []
+    for row in rowOrder:
+        for col in colOrder:
+            symbol = grid[col * 9 + row] if transposed else grid[row * 9 + col]
+            label = labels.get(symbol)
+            if label is None:
+                label = labels[symbol] = str(len(labels))
+            out.append(label)
+    return "".join(out), labels
+
+
+def canonicalForm(puzzle):
+    # Returns the canonical puzzle string ("0" for blanks) and the transform (transposed, row order, column order,
+    # digit map) that takes the puzzle to it.
+    grid = puzzle.replace(".", "0")
+    best = None
+    for transposed in (False, True):
+        rowOrders = limitedOrderings(lineKeys(grid, transposed))
+        colOrders = limitedOrderings(lineKeys(grid, not transposed))
+        if len(rowOrders) * len(colOrders) > MAX_ORDERINGS:
+            colOrders = colOrders[:1]
+        for rowOrder in rowOrders:
+            for colOrder in colOrders:
+                form, labels = relabeled(grid, transposed, rowOrder, colOrder)
+                if best is None or form < best[0]:
+                    best = (form, (transposed, rowOrder, colOrder, labels))
+    form, (transposed, rowOrder, colOrder, labels) = best
+    unused = [str(d) for d in range(1, 10) if str(d) not in labels.values()]
+    for symbol in "123456789":
+        if symbol not in labels:
+            labels[symbol] = unused.pop(0)
+    return form, (transposed, rowOrder, colOrder, labels)
+
+
+def applyInverse(canonical, transform):
+    # Maps a canonical grid string back into the frame of the puzzle the transform came from.
+    transposed, rowOrder, colOrder, labels = transform
+    unlabel = {label: symbol for symbol, label in labels.items()}
+    out = [""] * 81
+    for r, row in enumerate(rowOrder):
+        for c, col in enumerate(colOrder):
+            symbol = unlabel[canonical[r * 9 + c]]
+            out[col * 9 + row if transposed else row * 9 + col] = symbol
+    return "".join(out)
+
+
+class SolutionCache:
+    # LRU map from canonical puzzles to canonical solutions, optionally backed by SQLite. Failures are not cached,
+    # since a solver that gave up on a time budget may succeed on a later attempt.
+    def __init__(self, maxsize=100000, path=None, commitEvery=256):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.db = None
+        self.commitEvery = commitEvery
+        self.uncommitted = 0
+        if path is not None:
+            import sqlite3
+            self.db = sqlite3.connect(path, timeout=30)
+            self.db.execute("CREATE TABLE IF NOT EXISTS solutions (puzzle TEXT PRIMARY KEY, solution TEXT NOT NULL)")
+
+    def lookup(self, form):
+        solution = self.entries.get(form)
+        if solution is not None:
+            self.entries.move_to_end(form)
+            return solution
+        if self.db is not None:
+            row = self.db.execute("SELECT solution FROM solutions WHERE puzzle = ?", (form,)).fetchone()
+            if row is not None:
+                self.remember(form, row[0])
+                return row[0]
+        return None
+
+    def remember(self, form, solution):
+        self.entries[form] = solution
+        self.entries.move_to_end(form)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def store(self, form, solution):
+        self.remember(form, solution)
+        if self.db is not None:
+            self.db.execute("INSERT OR REPLACE INTO solutions VALUES (?, ?)", (form, solution))
+            self.uncommitted += 1
+            if self.uncommitted >= self.commitEvery:
+                self.commit()
+
+    def solve(self, puzzle, solver):
+        # solver maps a puzzle string to its solution string or None; it only runs on a cache miss. Only 9x9 puzzles
+        # are canonicalized, so larger boards go straight to the solver.
+        if len(puzzle) != 81:
+            return solver(puzzle)
+        form, transform = canonicalForm(puzzle)
+        solution = self.lookup(form)
+        if solution is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            solution = solver(form)
+            if solution is None:
+                return None
+            self.store(form, solution)
+        return applyInverse(solution, transform)
+
+    def commit(self):
+        if self.db is not None:
+            self.db.commit()
+            self.uncommitted = 0
+
+    def close(self):
+        if self.db is not None:
+            self.commit()
+            self.db.close()
+            self.db = None
+
+    def __len__(self):
+        return len(self.entries)
@@ -0,0 +1,129 @@
+# Joe Shymanski
+# Sudoku Solver - puzzle generator with difficulty grading
+# A puzzle starts as a random solution and loses clues one at a time. Since the puzzle before each removal is known to
+# be unique, removing a clue keeps it unique exactly when no solution puts another digit in that cell, so each check is
+# a search for one counterexample rather than a full count.
+import json
+import random
+import sys
+from SudokuSolver import Table, StepLog, geometryFor, iterChunks, orderedMap
+
+# Techniques from easiest to hardest, by the names they record in a StepLog.
+TECHNIQUE_LADDER = ["Peer Elimination", "Naked Single", "Hidden Single", "Naked Pair", "Hidden Pair", "Pointing Pair",
+                    "Box-Line Reduction", "Naked Triple", "Hidden Triple", "X-Wing", "Naked Quad", "Hidden Quad",
+                    "Swordfish", "XY-Wing", "Jellyfish", "Brute Force"]
+
+
+def toPuzzle(values, geometry):
+    symbols = "." + geometry.symbols
+    return "".join(symbols[value] for value in values)
+
+
+def randomSolution(rng, n=3):
+    # The boxes on the diagonal share no units, so they can be filled independently before the search completes them.
+    geometry = geometryFor(n)
+    values = [0] * geometry.cells
+    for box in range(0, geometry.size, n + 1):
+        for i, value in zip(geometry.boxIndices[box], rng.sample(range(1, geometry.size + 1), geometry.size)):
+            values[i] = value
+    table = Table.fromString(toPuzzle(values, geometry))
+    table.bruteForceSolve(False)
+    return table.values
+
+
+def removalKeepsUnique(values, index, geometry):
+    # values is a unique puzzle; the clue at index can go if no solution has a different digit there.
+    trial = values[:]
+    trial[index] = 0
+    table = Table.fromString(toPuzzle(trial, geometry))
+    table.masks[index] &= ~geometry.digitBit[values[index]]
+    return table.countSolutions(1) == 0
+
+
+def removeClues(values, order, clues=0, geometry=None):
+    # Tries the cells in order, keeping the puzzle unique, until only `clues` clues are left or none can go.
+    if geometry is None:
+        geometry = geometryFor(3)
+    filled = sum(1 for value in values if value)
+    for i in order:
+        if filled <= clues:
+            break
+        if values[i] and removalKeepsUnique(values, i, geometry):
+            values[i] = 0
+            filled -= 1
+    return values
+
+
+def grade(puzzle):
+    # The hardest technique deductiveSolve needed and its number of steps; "Brute Force" means it had to search.
+    table = Table.fromString(puzzle)
+    table.log = StepLog()
+    steps = table.deductiveSolve(False)
+    hardest = max((step.technique for step in table.log), key=TECHNIQUE_LADDER.index, default=TECHNIQUE_LADDER[0])
+    return hardest, steps
+
+
+def generatePuzzle(rng, n=3, clues=0):
+    geometry = geometryFor(n)
+    solution = randomSolution(rng, n)
+    values = removeClues(solution[:], rng.sample(range(geometry.cells), geometry.cells), clues, geometry)
+    puzzle = toPuzzle(values, geometry)
+    hardest, steps = grade(puzzle)
+    return {
+        "puzzle": puzzle,
+        "solution": toPuzzle(solution, geometry),
+        "clues": geometry.cells - values.count(0),
+        "hardest": hardest,
+        "steps": steps,
+    }
+
+
+def generateChunk(seeds, n=3, clues=0):
+    return [generatePuzzle(random.Random(seed), n, clues) for seed in seeds]
+
+
+def generateMany(count, seed=0, workers=None, chunksize=16, n=3, clues=0):
+    # Yields count graded puzzles in order. Each puzzle has its own seed, so the output depends only on seed and count,
+    # not on the number of workers.
+    chunks = iterChunks(("%d:%d" % (seed, index) for index in range(count)), chunksize)
+    for records in orderedMap(generateChunk, ((chunk, n, clues) for chunk in chunks), workers):
+        yield from records
+
+
+def writeRecords(records, path="-", format="jsonl"):
+    # jsonl writes every field of a record; line and grid write only the puzzles, readable by SudokuIO.
+    import SudokuIO
+    if format != "jsonl":
+        return SudokuIO.writePuzzles((record["puzzle"] for record in records), path, format)
+    file = SudokuIO.openText(path, "w")
+    try:
+        count = 0
+        for record in records:
+            file.write(json.dumps(record) + "\n")
+            count += 1
+        return count
+    finally:
+        if file is sys.stdout:
+            file.flush()
+        else:
+            file.close()
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Sudoku puzzle generator")
+    parser.add_argument("--count", type=int, default=10, help="puzzles to generate")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the whole run")
+    parser.add_argument("--clues", type=int, default=0, help="stop removing clues at this many (0: as few as possible)")
+    parser.add_argument("--box-size", type=int, default=3, help="3 for 9x9 boards, 4 for 16x16, 5 for 25x25")
+    parser.add_argument("--workers", type=int, help="worker processes (default: all cores)")
+    parser.add_argument("--chunksize", type=int, default=16, help="puzzles per task sent to a worker")
+    parser.add_argument("--output", default="-", help="output file, .gz to compress (default: stdout)")
+    parser.add_argument("--output-format", choices=["jsonl", "line", "grid"], default="jsonl")
+    args = parser.parse_args(argv)
+    records = generateMany(args.count, args.seed, args.workers, args.chunksize, args.box_size, args.clues)
+    return writeRecords(records, args.output, args.output_format)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
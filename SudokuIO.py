@@ -0,0 +1,115 @@
+# Joe Shymanski
+# Sudoku Solver - streaming puzzle input and output
+import sys
+
+BLANKS = ".0"
+SYMBOLS = "123456789ABCDEFGHIJKLMNOP"
+SIZES = (9, 16, 25)
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+def openText(path, mode="r"):
+    # "-" is stdin/stdout; gzip is detected by extension when writing and by magic bytes when reading.
+    if path == "-":
+        return sys.stdin if "r" in mode else sys.stdout
+    compressed = path.endswith(".gz")
+    if "r" in mode:
+        with open(path, "rb") as file:
+            compressed = file.read(2) == GZIP_MAGIC
+    if compressed:
+        import gzip
+        return gzip.open(path, mode + "t")
+    return open(path, mode)
+
+
+def isCellSymbol(symbol, size=9):
+    return len(symbol) == 1 and (symbol.upper() in SYMBOLS[:size] or symbol in BLANKS)
+
+
+def normalized(cells):
+    return "".join(cells).upper().replace("0", ".")
+
+
+def parseLine(line):
+    # Returns the puzzle on a one-line record, the cells of a grid row, or None for anything else. Boards are 9x9,
+    # 16x16 or 25x25, with the letters A-P (in either case) as the digits past 9.
+    tokens = line.split()
+    for size in SIZES:
+        if len(tokens) == 1 and len(tokens[0]) == size * size and all(isCellSymbol(s, size) for s in tokens[0]):
+            return tokens[0]
+        if len(tokens) == size and all(isCellSymbol(s, size) for s in tokens):
+            return tokens
+    return None
+
+
+def iterPuzzles(lines, until=None, format="auto", strict=False):
+    # Yields each puzzle as a string of 81, 256 or 625 symbols with "." for blanks. One-line records and grids (one
+    # line per row) may be mixed freely; any other line (separators, titles, comments) ends a partial grid and is
+    # skipped. Reading stops at the first line starting with `until`, if given. format="line" or "grid" reads only
+    # that kind of puzzle and skips the other like any other line. With strict, nothing is skipped silently: each
+    # other non-blank line, and each grid left unfinished, yields None in its place.
+    rows = []
+    width = 0
+    for line in lines:
+        if until is not None and line.startswith(until):
+            break
+        parsed = parseLine(line)
+        if parsed is None or format == "line" and not isinstance(parsed, str) or \
+                format == "grid" and isinstance(parsed, str):
+            if strict and rows:
+                yield None
+            rows = []
+            if strict and line.strip():
+                yield None
+        elif isinstance(parsed, str):
+            if strict and rows:
+                yield None
+            rows = []
+            yield normalized(parsed)
+        else:
+            if len(parsed) != width:
+                if strict and rows:
+                    yield None
+                rows = []
+                width = len(parsed)
+            rows.extend(parsed)
+            if len(rows) == width * width:
+                yield normalized(rows)
+                rows = []
+    if strict and rows:
+        yield None
+
+
+def readPuzzles(path, until=None, format="auto"):
+    file = openText(path, "r")
+    try:
+        yield from iterPuzzles(file, until, format)
+    finally:
+        if file is not sys.stdin:
+            file.close()
+
+
+def formatGrid(puzzle):
+    size = round(len(puzzle) ** 0.5)
+    return "\n".join(" ".join(puzzle[row * size:row * size + size]) for row in range(size)) + "\n"
+
+
+def writePuzzles(puzzles, path="-", format="line", unsolved="unsolved"):
+    # Writes puzzles (or solutions) as they arrive; None entries are written as the `unsolved` marker.
+    file = openText(path, "w")
+    try:
+        count = 0
+        for puzzle in puzzles:
+            if format == "grid":
+                if count:
+                    file.write("\n")
+                file.write(formatGrid(puzzle) if puzzle is not None else unsolved + "\n")
+            else:
+                file.write((puzzle if puzzle is not None else unsolved) + "\n")
+            count += 1
+        return count
+    finally:
+        if file is sys.stdout:
+            file.flush()
+        else:
+            file.close()
@@ -0,0 +1,247 @@
+# Joe Shymanski
+# Sudoku Solver - local solve service
+# A long-running asyncio server in front of a warm process pool, on TCP or a Unix socket. Each request is one line of
+# JSON and gets one line of JSON back, tagged with the request's "id" if it had one:
+#   {"id": 1, "puzzle": "..."}                  -> {"id": 1, "status": "solved", "solution": "..."}
+#   {"id": 2, "puzzles": [...], "timeout": 5}   -> {"id": 2, "status": "done", "solutions": [..., null, ...]}
+#   {"cancel": 2}                               -> {"id": 2, "status": "cancelled"}
+# A bare puzzle line is read as {"puzzle": line}. Requests on one connection run concurrently, so their responses can
+# arrive out of order. Puzzles use the one-line format of SudokuIO (81, 256 or 625 symbols, "." or "0" for blanks).
+import asyncio
+import json
+import os
+import sys
+import time
+import SudokuIO
+from SudokuSolver import solveChunk, iterChunks
+
+# Longest request line accepted; a batch of 100000 9x9 puzzles fits.
+MAX_REQUEST_BYTES = 1 << 24
+
+
+def warmUp():
+    # Runs once in each worker so that the first real request does not pay for imports and table construction.
+    return solveChunk(["." * 81])
+
+
+class SolverService:
+    # Requests are cut into chunks that wait in a bounded queue; one dispatcher per worker moves chunks from the
+    # queue into the pool, so the pool never holds more than one chunk per worker. Each request is queued and answered
+    # by a task of its own, so a connection keeps being read (and can cancel) while its requests wait for room. Once
+    # a connection has maxRequests requests in flight the server stops reading from it, which pushes back on the
+    # client through its socket.
+    def __init__(self, workers=None, queueSize=256, timeout=None, chunksize=64, maxRequests=64):
+        self.workers = workers or os.cpu_count() or 1
+        self.queueSize = queueSize
+        self.timeout = timeout
+        self.chunksize = chunksize
+        self.maxRequests = maxRequests
+        self.executor = None
+        self.queue = None
+        self.dispatchers = []
+        self.server = None
+
+    async def start(self, host="127.0.0.1", port=8765, path=None):
+        from concurrent.futures import ProcessPoolExecutor
+        loop = asyncio.get_running_loop()
+        self.executor = ProcessPoolExecutor(self.workers)
+        await asyncio.gather(*(loop.run_in_executor(self.executor, warmUp) for _ in range(self.workers)))
+        self.queue = asyncio.Queue(self.queueSize)
+        self.dispatchers = [asyncio.create_task(self.dispatch()) for _ in range(self.workers)]
+        if path is not None:
+            self.server = await asyncio.start_unix_server(self.handleClient, path, limit=MAX_REQUEST_BYTES)
+        else:
+            self.server = await asyncio.start_server(self.handleClient, host, port, limit=MAX_REQUEST_BYTES)
+        return self.server
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        for dispatcher in self.dispatchers:
+            dispatcher.cancel()
+        await asyncio.gather(*self.dispatchers, return_exceptions=True)
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+
+    async def dispatch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            chunk, timeout, deadline, result = await self.queue.get()
+            # Chunks of requests that were cancelled or timed out while queued are dropped unsolved.
+            if result.done():
+                continue
+            # The request's deadline goes to the worker as wall-clock time, so that a chunk stops with its request
+            # rather than giving each of its puzzles the full timeout.
+            until = None if deadline is None else time.time() + deadline - loop.time()
+            try:
+                solutions = await loop.run_in_executor(self.executor, solveChunk, chunk, timeout, "scalar", 0, None,
+                                                       until)
+            except Exception as error:
+                if not result.done():
+                    result.set_exception(error)
+            else:
+                if not result.done():
+                    result.set_result(solutions)
+
+    async def submit(self, puzzles, timeout, deadline, results):
+        # Queues the chunks of a request, waiting for room as needed, and returns their solutions once all are in.
+        # The future of each chunk goes into results before it is queued, so that a request cancelled halfway through
+        # queueing can cancel what it already queued. deadline is the event loop time at which the request times out,
+        # or None.
+        loop = asyncio.get_running_loop()
+        for chunk in iterChunks(puzzles, self.chunksize):
+            result = loop.create_future()
+            results.append(result)
+            await self.queue.put((chunk, timeout, deadline, result))
+        return await asyncio.gather(*results)
+
+    async def handleClient(self, reader, writer):
+        pending = {}
+        lock = asyncio.Lock()
+        inFlight = asyncio.Semaphore(self.maxRequests)
+
+        async def respond(response):
+            async with lock:
+                if writer.is_closing():
+                    return
+                try:
+                    writer.write(json.dumps(response).encode("ascii") + b"\n")
+                    await writer.drain()
+                except ConnectionError:
+                    pass
+
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    await respond({"status": "error", "error": "Request longer than %d bytes" % MAX_REQUEST_BYTES})
+                    break
+                if not line:
+                    break
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    request = json.loads(line) if line.startswith(b"{") else {"puzzle": line.decode("ascii")}
+                    if not isinstance(request, dict):
+                        raise ValueError("Expected a JSON object")
+                except ValueError as error:
+                    await respond({"status": "error", "error": str(error)})
+                    continue
+                requestId = request.get("id")
+                if not isinstance(requestId, (str, int, type(None))):
+                    await respond({"status": "error", "error": "id must be a string or an integer"})
+                    continue
+                if "cancel" in request:
+                    if not isinstance(request["cancel"], (str, int, type(None))):
+                        await respond({"id": requestId, "status": "error",
+                                       "error": "cancel must be a string or an integer"})
+                        continue
+                    cancelled = pending.pop(request["cancel"], None)
+                    if cancelled is not None:
+                        self.cancel(*cancelled)
+                    await respond({"id": request["cancel"], "status": "cancelled" if cancelled else "unknown"})
+                    continue
+                try:
+                    puzzles, timeout = self.parseRequest(request)
+                except ValueError as error:
+                    await respond({"id": requestId, "status": "error", "error": str(error)})
+                    continue
+                deadline = asyncio.get_running_loop().time() + timeout if timeout is not None else None
+                await inFlight.acquire()
+                results = []
+                task = asyncio.create_task(self.finish(request, puzzles, timeout, deadline, results, respond))
+                task.add_done_callback(lambda _: inFlight.release())
+                if requestId is not None:
+                    pending[requestId] = (task, results)
+                    task.add_done_callback(lambda _, requestId=requestId: pending.pop(requestId, None))
+        except ConnectionError:
+            pass
+        finally:
+            # A client that goes away takes its unfinished requests with it.
+            for task, results in pending.values():
+                self.cancel(task, results)
+            writer.close()
+
+    def cancel(self, task, results):
+        # The chunk futures are cancelled along with the task, since a task cancelled before it first runs never
+        # gets to clean up after itself; queued chunks are then skipped by the dispatchers.
+        task.cancel()
+        for result in results:
+            result.cancel()
+
+    def parseRequest(self, request):
+        if "puzzle" in request:
+            puzzles = [request["puzzle"]]
+        elif "puzzles" in request and isinstance(request["puzzles"], list):
+            puzzles = request["puzzles"]
+        else:
+            raise ValueError("Expected \"puzzle\" or \"puzzles\"")
+        for puzzle in puzzles:
+            if not isinstance(puzzle, str) or not isinstance(SudokuIO.parseLine(puzzle), str):
+                raise ValueError("Not a one-line puzzle: " + repr(puzzle))
+        timeout = request.get("timeout", self.timeout)
+        if timeout is not None and (not isinstance(timeout, (int, float)) or timeout <= 0):
+            raise ValueError("timeout must be a positive number of seconds")
+        return [SudokuIO.normalized(puzzle) for puzzle in puzzles], timeout
+
+    async def finish(self, request, puzzles, timeout, deadline, results, respond):
+        # Runs a request from queueing its chunks to sending its response; the timeout counts the wait for room.
+        response = {"id": request.get("id")}
+        try:
+            remaining = None if deadline is None else max(0, deadline - asyncio.get_running_loop().time())
+            chunks = await asyncio.wait_for(self.submit(puzzles, timeout, deadline, results), remaining)
+        except asyncio.TimeoutError:
+            response["status"] = "timeout"
+        except Exception as error:
+            response["status"] = "error"
+            response["error"] = str(error)
+        else:
+            solutions = [solution for chunk in chunks for solution in chunk]
+            if "puzzle" in request:
+                response["status"] = "solved" if solutions[0] is not None else "unsolved"
+                response["solution"] = solutions[0]
+            else:
+                response["status"] = "done"
+                response["solutions"] = solutions
+        finally:
+            for result in results:
+                result.cancel()
+        await respond(response)
+
+
+async def serve(host="127.0.0.1", port=8765, path=None, workers=None, queueSize=256, timeout=None, chunksize=64,
+                maxRequests=64):
+    service = SolverService(workers, queueSize, timeout, chunksize, maxRequests)
+    server = await service.start(host, port, path)
+    print("Serving on", path or "%s:%d" % (host, port), file=sys.stderr)
+    try:
+        await server.serve_forever()
+    finally:
+        await service.close()
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Sudoku Solver service")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    parser.add_argument("--port", type=int, default=8765, help="TCP port to listen on")
+    parser.add_argument("--unix", help="listen on this Unix socket instead of TCP")
+    parser.add_argument("--workers", type=int, help="worker processes (default: all cores)")
+    parser.add_argument("--queue-size", type=int, default=256, help="chunks that may wait for a worker")
+    parser.add_argument("--timeout", type=float, help="default seconds allowed per request")
+    parser.add_argument("--chunksize", type=int, default=64, help="puzzles per chunk of a batch")
+    parser.add_argument("--max-requests", type=int, default=64,
+                        help="requests one connection may have in flight before it stops being read")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.host, args.port, args.unix, args.workers, args.queue_size, args.timeout,
+                          args.chunksize, args.max_requests))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
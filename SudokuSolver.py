@@ -1,458 +1,1603 @@
 # Joe Shymanski
 # Sudoku Solver
+import itertools
+import os
+import sys
 import time
-import copy
+from array import array
+from collections import namedtuple
+
+# Symbols for boards of box size n use the first n * n of these; "." (and "0" unless it is a symbol) is blank.
+SYMBOLS = "123456789ABCDEFGHIJKLMNOP"
+
+
+class BitCount:
+    # Stands in for the popcount table when masks are too wide to tabulate.
+    def __getitem__(self, mask):
+        return bin(mask).count("1")
+
+
+class LowestBit:
+    def __getitem__(self, mask):
+        return (mask & -mask).bit_length()
+
+
+class MaskBits:
+    def __init__(self, size):
+        self.size = size
+
+    def __getitem__(self, mask):
+        return tuple(d for d in range(1, self.size + 1) if mask >> (d - 1) & 1)
+
+
+class Geometry:
+    # Index tables for an n * n by n * n board, built once per box size by geometryFor. Candidates are stored as
+    # (n * n)-bit masks: bit d - 1 is set when digit d is still possible. Masks of up to 16 bits are small enough for
+    # popcount, lowest-digit and digit-tuple lookup tables; wider ones compute them.
+    def __init__(self, n, symbols=None):
+        size = n * n
+        cells = size * size
+        self.n = n
+        self.size = size
+        self.cells = cells
+        self.symbols = symbols or SYMBOLS[:size]
+        if len(self.symbols) != size:
+            raise ValueError("Box size " + str(n) + " needs " + str(size) + " symbols")
+        self.allCandidates = (1 << size) - 1
+        self.digitBit = [0] + [1 << (d - 1) for d in range(1, size + 1)]
+        self.maskType = "H" if size <= 16 else "L"
+        if size <= 16:
+            self.popcount = bytes(bin(m).count("1") for m in range(1 << size))
+            self.lowestDigit = bytes((m & -m).bit_length() for m in range(1 << size))
+            self.maskDigits = [tuple(d for d in range(1, size + 1) if m & self.digitBit[d]) for m in range(1 << size)]
+        else:
+            self.popcount = BitCount()
+            self.lowestDigit = LowestBit()
+            self.maskDigits = MaskBits(size)
+        # Byte translation tables from puzzle symbols to cell values and to candidate masks (anything else is blank).
+        symbolValues = bytearray(256)
+        for value, symbol in enumerate(self.symbols, 1):
+            symbolValues[ord(symbol)] = value
+            symbolValues[ord(symbol.lower())] = value
+        self.symbolValues = bytes(symbolValues)
+        self.symbolMasks = [self.digitBit[v] or self.allCandidates for v in self.symbolValues]
+
+        self.rowIndices = [[row * size + col for col in range(size)] for row in range(size)]
+        self.colIndices = [[row * size + col for row in range(size)] for col in range(size)]
+        self.boxIndices = [[(box // n) * n * size + (box % n) * n + row * size + col for row in range(n) for col in range(n)]
+                           for box in range(size)]
+        self.groups = [("Row", self.rowIndices, 0), ("Column", self.colIndices, size), ("Box", self.boxIndices, 2 * size)]
+
+        # Units are numbered rows first, then columns, then boxes.
+        self.units = self.rowIndices + self.colIndices + self.boxIndices
+        self.rowOf = [i // size for i in range(cells)]
+        self.colOf = [i % size for i in range(cells)]
+        self.boxOf = [(i // (n * size)) * n + (i % size) // n for i in range(cells)]
+        self.cellUnits = [(self.rowOf[i], size + self.colOf[i], 2 * size + self.boxOf[i]) for i in range(cells)]
+        self.peers = [tuple(sorted({p for u in self.cellUnits[i] for p in self.units[u]} - {i})) for i in range(cells)]
+        self.peerSets = [frozenset(peers) for peers in self.peers]
+        # The ways each unit splits into its n intersections with crossing units: rows and columns into box segments,
+        # boxes into row segments and into column segments. Each segment comes with the rest of its crossing unit.
+        self.segments = []
+        for unit, unitCells in enumerate(self.units):
+            if unit < 2 * size:
+                splits = [[unitCells[k * n:k * n + n] for k in range(n)]]
+                crossUnits = [[self.boxIndices[self.boxOf[split[0]]] for split in splits[0]]]
+            else:
+                splits = [[unitCells[k * n:k * n + n] for k in range(n)], [unitCells[k::n] for k in range(n)]]
+                crossUnits = [[self.rowIndices[self.rowOf[split[0]]] for split in splits[0]],
+                              [self.colIndices[self.colOf[split[0]]] for split in splits[1]]]
+            self.segments.append([[(tuple(segment), tuple(i for i in cross if i not in segment))
+                                   for segment, cross in zip(segments, crosses)]
+                                  for segments, crosses in zip(splits, crossUnits)])
+
+        # Exact cover rows are (cell, digit) placements numbered cell * size + digit - 1. Each one covers four
+        # constraint columns: the cell is filled, and its row, column and box contain the digit.
+        self.coverRows = [(i, cells + self.rowOf[i] * size + d, 2 * cells + self.colOf[i] * size + d,
+                           3 * cells + self.boxOf[i] * size + d)
+                          for i in range(cells) for d in range(size)]
+
+
+geometries = {}
+
+
+def geometryFor(n=3, symbols=None):
+    geometry = geometries.get((n, symbols))
+    if geometry is None:
+        geometry = geometries[(n, symbols)] = Geometry(n, symbols)
+    return geometry
+
+
+def boxSizeFor(cells):
+    n = round(cells ** 0.25)
+    if n < 2 or n ** 4 != cells:
+        raise ValueError("Expected 81, 256 or 625 cells, got " + str(cells))
+    return n
+
+
+STANDARD = geometryFor(3)
+SEARCH_CHECK_INTERVAL = 1024
+
+
+def coverRow(columns, coverRows, row):
+    removed = []
+    for j in coverRows[row]:
+        for i in columns[j]:
+            for k in coverRows[i]:
+                if k != j:
+                    columns[k].discard(i)
+        removed.append(columns.pop(j))
+    return removed
+
+
+def uncoverRow(columns, coverRows, row, removed):
+    for j in reversed(coverRows[row]):
+        columns[j] = removed.pop()
+        for i in columns[j]:
+            for k in coverRows[i]:
+                if k != j:
+                    columns[k].add(i)
+
+
+def exactCoverSearch(values, masks, limit=1, deadline=None, geometry=None, metrics=None, stop=None):
+    # Algorithm X over the placements still allowed by the masks, always branching on the constraint with the
+    # fewest options. The search keeps its own stack, so its depth is never bounded by the recursion limit.
+    # Returns the solutions found (as value lists) and whether the deadline, or stop (an Event, set from elsewhere to
+    # call the search off), cut the search short. Its node, backtrack and depth counts go to metrics, a SolveMetrics,
+    # if one is given.
+    if geometry is None:
+        geometry = geometryFor(boxSizeFor(len(values)))
+    size = geometry.size
+    coverRows = geometry.coverRows
+    maskDigits = geometry.maskDigits
+    # The filled cells are taken as already chosen: their columns are left out, along with every placement that
+    # would cover one of them again. Two filled cells covering the same column means there is no solution.
+    covered = set()
+    for i in range(geometry.cells):
+        if values[i]:
+            for j in coverRows[i * size + values[i] - 1]:
+                if j in covered:
+                    return [], False
+                covered.add(j)
+    columns = {j: set() for j in range(4 * geometry.cells) if j not in covered}
+    for i in range(geometry.cells):
+        if values[i] == 0:
+            for d in maskDigits[masks[i]]:
+                row = i * size + d - 1
+                rowColumns = coverRows[row]
+                if not covered.intersection(rowColumns):
+                    for j in rowColumns:
+                        columns[j].add(row)
+    solutions = []
+    chosen = []
+    stack = []
+    nodes = backtracks = maxDepth = 0
+    timedOut = False
+    while True:
+        if columns:
+            stack.append([list(min(columns.values(), key=len)), 0, None])
+        else:
+            solution = list(values)
+            for row in chosen:
+                solution[row // size] = row % size + 1
+            solutions.append(solution)
+            if len(solutions) >= limit:
+                break
+        while stack:
+            frame = stack[-1]
+            if frame[2] is not None:
+                uncoverRow(columns, coverRows, chosen.pop(), frame[2])
+                frame[2] = None
+                backtracks += 1
+            if frame[1] < len(frame[0]):
+                row = frame[0][frame[1]]
+                frame[1] += 1
+                frame[2] = coverRow(columns, coverRows, row)
+                chosen.append(row)
+                break
+            stack.pop()
+        else:
+            break
+        nodes += 1
+        if len(chosen) > maxDepth:
+            maxDepth = len(chosen)
+        if nodes % SEARCH_CHECK_INTERVAL == 0 and (deadline is not None and time.perf_counter() > deadline or
+                                                  stop is not None and stop.is_set()):
+            timedOut = True
+            break
+    if metrics is not None:
+        metrics.searched(nodes, backtracks, maxDepth)
+    return solutions, timedOut
+
+
+def backtrackSearch(values, masks, limit=1, deadline=None, geometry=None, metrics=None, stop=None,
+                    intersections=False):
+    # Depth-first search over the cells, always branching on the empty cell with the fewest candidates, with naked
+    # and hidden singles followed up at every node. Every change to a value or mask is pushed on a trail first, so a
+    # choice is undone by unwinding the trail to where the choice started, at O(changes). The trail, the singles queue
+    # and the choice stack are arrays sized for the worst case up front, so the search loop itself allocates nothing.
+    # With intersections, every node also applies pointing pairs and box-line reductions. Takes, returns and reports
+    # what exactCoverSearch does.
+    if geometry is None:
+        geometry = geometryFor(boxSizeFor(len(values)))
+    cells = geometry.cells
+    peers = geometry.peers
+    popcount = geometry.popcount
+    lowestDigit = geometry.lowestDigit
+    digitBit = geometry.digitBit
+    units = geometry.units
+    allCandidates = geometry.allCandidates
+    values = list(values)
+    masks = array(geometry.maskType, masks)
+    # A path through the tree places each cell once and clears each candidate bit once, plus a mark per choice.
+    capacity = cells * (geometry.size + 2)
+    trailCells = array("l", [0]) * capacity
+    trailMasks = array(geometry.maskType, [0]) * capacity
+    queue = array("l", [0]) * cells
+    choiceCells = array("l", [0]) * cells
+    choiceOptions = array(geometry.maskType, [0]) * cells
+    choiceTrails = array("l", [0]) * cells
+    segments = geometry.segments
+    segmentMasks = array(geometry.maskType, [0]) * geometry.n
+    top = 0
+
+    def assign(index, bit):
+        # Places bit at index and every naked single that follows; False on a contradiction. Placements go on the
+        # trail as ~index, since undoing one only clears the value.
+        nonlocal top
+        trailCells[top] = index
+        trailMasks[top] = masks[index]
+        top += 1
+        masks[index] = bit
+        queue[0] = index
+        pending = 1
+        while pending:
+            pending -= 1
+            i = queue[pending]
+            if values[i]:
+                continue
+            bit = masks[i]
+            if not bit:
+                return False
+            trailCells[top] = ~i
+            top += 1
+            values[i] = lowestDigit[bit]
+            for p in peers[i]:
+                mask = masks[p]
+                if mask & bit:
+                    if values[p]:
+                        return False
+                    trailCells[top] = p
+                    trailMasks[top] = mask
+                    top += 1
+                    mask ^= bit
+                    masks[p] = mask
+                    if not mask:
+                        return False
+                    if not mask & (mask - 1):
+                        queue[pending] = p
+                        pending += 1
+        return True
+
+    def reduceIntersections():
+        # A digit confined to one intersection of a unit with a crossing unit is struck from the rest of the crossing
+        # unit, as in findBoxLineReductions. Returns None on a contradiction, otherwise whether anything changed.
+        nonlocal top
+        changed = False
+        for unitSegments in segments:
+            for split in unitSegments:
+                for k in range(len(split)):
+                    mask = 0
+                    for i in split[k][0]:
+                        if not values[i]:
+                            mask |= masks[i]
+                    segmentMasks[k] = mask
+                for k in range(len(split)):
+                    others = 0
+                    for other in range(len(split)):
+                        if other != k:
+                            others |= segmentMasks[other]
+                    confined = segmentMasks[k] & ~others
+                    if not confined:
+                        continue
+                    for i in split[k][1]:
+                        mask = masks[i]
+                        if not values[i] and mask & confined:
+                            trailCells[top] = i
+                            trailMasks[top] = mask
+                            top += 1
+                            mask &= ~confined
+                            masks[i] = mask
+                            changed = True
+                            if not mask or not mask & (mask - 1) and not assign(i, mask):
+                                return None
+        return changed
+
+    # The givens are checked against each other and struck from their peers, then the singles this leaves are placed.
+    # None of this is ever undone, so the trail it leaves sits below every choice.
+    for i in range(cells):
+        if values[i]:
+            bit = digitBit[values[i]]
+            masks[i] = bit
+            for p in peers[i]:
+                if values[p] == values[i]:
+                    return [], False
+                masks[p] &= ~bit
+    for i in range(cells):
+        if not values[i] and not masks[i]:
+            return [], False
+    ok = True
+    for i in range(cells):
+        mask = masks[i]
+        if not values[i] and not mask & (mask - 1) and not assign(i, mask):
+            ok = False
+            break
+    solutions = []
+    depth = nodes = backtracks = maxDepth = 0
+    timedOut = False
+    if ok:
+        while True:
+            # Hidden singles are placed until none are left, as part of the current node, followed by the
+            # intersections if asked for (and by hidden singles again whenever those change something).
+            progress = True
+            while ok and progress:
+                progress = False
+                for unit in units:
+                    once = twice = placed = 0
+                    for i in unit:
+                        mask = masks[i]
+                        if values[i]:
+                            placed |= mask
+                        else:
+                            twice |= once & mask
+                            once |= mask
+                    if once | placed != allCandidates:
+                        ok = False
+                        break
+                    single = once & ~twice
+                    if single:
+                        bit = single & -single
+                        for i in unit:
+                            if masks[i] & bit:
+                                break
+                        if not assign(i, bit):
+                            ok = False
+                            break
+                        progress = True
+                if ok and not progress and intersections:
+                    progress = reduceIntersections()
+                    ok = progress is not None
+            if ok:
+                best = -1
+                fewest = geometry.size + 1
+                for i in range(cells):
+                    if not values[i]:
+                        count = popcount[masks[i]]
+                        if count < fewest:
+                            best = i
+                            fewest = count
+                            if count == 2:
+                                break
+                if best < 0:
+                    solutions.append(list(values))
+                    if len(solutions) >= limit:
+                        break
+                else:
+                    choiceCells[depth] = best
+                    choiceOptions[depth] = masks[best]
+                    choiceTrails[depth] = top
+                    depth += 1
+            else:
+                backtracks += 1
+            while depth:
+                start = choiceTrails[depth - 1]
+                while top > start:
+                    top -= 1
+                    i = trailCells[top]
+                    if i < 0:
+                        values[~i] = 0
+                    else:
+                        masks[i] = trailMasks[top]
+                options = choiceOptions[depth - 1]
+                if options:
+                    bit = options & -options
+                    choiceOptions[depth - 1] = options ^ bit
+                    ok = assign(choiceCells[depth - 1], bit)
+                    break
+                depth -= 1
+            else:
+                break
+            nodes += 1
+            if depth > maxDepth:
+                maxDepth = depth
+            # A node here costs a scan of every cell and unit, next to which reading the clock is free, so unlike
+            # exactCoverSearch the deadline is checked at every node: on big boards a node can take a millisecond.
+            if deadline is not None and time.perf_counter() > deadline or stop is not None and stop.is_set():
+                timedOut = True
+                break
+    if metrics is not None:
+        metrics.searched(nodes, backtracks, maxDepth)
+    return solutions, timedOut
+
+
+SEARCH_ENGINES = {"dlx": exactCoverSearch, "backtrack": backtrackSearch}
+
+
+def splitSearch(values, masks, geometry, pieces):
+    # Cuts the top of the search tree into independent subproblems, each fixing one combination of candidates for the
+    # most constrained cells, and widens the cut a level at a time until there are at least `pieces` of them (or
+    # every subproblem is solved). The subproblems partition the solutions, so counts over them simply add up.
+    cells = geometry.cells
+    peers = geometry.peers
+    popcount = geometry.popcount
+    digitBit = geometry.digitBit
+    values = list(values)
+    masks = array(geometry.maskType, masks)
+    for i in range(cells):
+        if values[i]:
+            for p in peers[i]:
+                masks[p] &= ~digitBit[values[i]]
+    frontier = [(values, masks)]
+    while len(frontier) < pieces:
+        children = []
+        expanded = False
+        for values, masks in frontier:
+            best = -1
+            fewest = geometry.size + 1
+            for i in range(cells):
+                if not values[i] and popcount[masks[i]] < fewest:
+                    best = i
+                    fewest = popcount[masks[i]]
+            if best < 0:
+                children.append((values, masks))
+                continue
+            expanded = True
+            for digit in geometry.maskDigits[masks[best]]:
+                # Placing a digit strikes it from the peers; a subproblem that this empties a cell of is dropped.
+                bit = digitBit[digit]
+                childValues = values[:]
+                childMasks = array(geometry.maskType, masks)
+                childValues[best] = digit
+                childMasks[best] = bit
+                for p in peers[best]:
+                    if childValues[p] == digit:
+                        break
+                    childMasks[p] &= ~bit
+                    if not childValues[p] and not childMasks[p]:
+                        break
+                else:
+                    children.append((childValues, childMasks))
+        frontier = children
+        if not expanded:
+            break
+    return frontier
+
+
+searchStop = None
+
+
+def setSearchStop(stop):
+    # Pool initializer: the Event that parallelSearch sets to call off the searches still running.
+    global searchStop
+    searchStop = stop
+
+
+def searchPiece(values, masks, limit, n, engine):
+    metrics = SolveMetrics()
+    solutions, stopped = SEARCH_ENGINES[engine](values, masks, limit, None, geometryFor(n), metrics, searchStop)
+    return solutions, metrics
+
+
+def parallelSearch(values, masks, limit=1, deadline=None, geometry=None, metrics=None, workers=None,
+                   engine="backtrack", pieces=None):
+    # Runs the subproblems of splitSearch on a process pool. There are many more subproblems than workers, and each
+    # worker takes the next one from the shared queue as soon as it is free, so a worker that drew an easy subtree
+    # moves on rather than waiting for the others. Once limit solutions are in or the deadline passes, the queued
+    # subproblems are cancelled and an Event stops the searches still running. Returns what exactCoverSearch does;
+    # with more solutions than limit, which ones come back depends on which workers finish first.
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+    if geometry is None:
+        geometry = geometryFor(boxSizeFor(len(values)))
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if pieces is None:
+        pieces = workers * 16
+    solutions = []
+    timedOut = False
+    frontier = splitSearch(values, masks, geometry, pieces)
+    if not frontier:
+        return solutions, timedOut
+    stop = multiprocessing.Event()
+    executor = ProcessPoolExecutor(workers, initializer=setSearchStop, initargs=(stop,))
+    try:
+        pending = [executor.submit(searchPiece, pieceValues, pieceMasks, limit, geometry.n, engine)
+                   for pieceValues, pieceMasks in frontier]
+        while pending and len(solutions) < limit:
+            remaining = None if deadline is None else deadline - time.perf_counter()
+            if remaining is not None and remaining <= 0:
+                timedOut = True
+                break
+            done, pending = wait(pending, remaining, FIRST_COMPLETED)
+            for future in done:
+                found, counts = future.result()
+                solutions.extend(found)
+                if metrics is not None:
+                    metrics.merge(counts)
+    finally:
+        stop.set()
+        executor.shutdown(cancel_futures=True)
+    return solutions[:limit], timedOut
+
+
+class CandidateList(list):
+    # The list Cell.candidates returns. Editing it in place (remove, append and the like) writes the result back to
+    # the cell's mask, as editing the stored list did before cells kept masks; copies such as [:] are plain lists.
+    __slots__ = ("cell",)
+
+    def __init__(self, cell, digits):
+        super().__init__(digits)
+        self.cell = cell
+
+
+def writesBack(name):
+    method = getattr(list, name)
+
+    def edit(self, *args):
+        result = method(self, *args)
+        self.cell.candidates = self
+        return result
+    return edit
+
+
+for name in ("append", "extend", "insert", "remove", "pop", "clear", "__setitem__", "__delitem__", "__iadd__"):
+    setattr(CandidateList, name, writesBack(name))
+
 
 class Cell:
-    def __init__(self, val):
-        self.value = int(val) if str(val) in "123456789" else 0
-        self.candidates = [1, 2, 3, 4, 5, 6, 7, 8, 9] if self.value == 0 else [self.value]
+    # A cell owns its value and mask until it is added to a Table, after which it is a view onto the table.
+    # A cell also remembers what it was built from, so that a Table of another size can read it again with its own
+    # geometry, as long as it has not been edited since.
+    __slots__ = ("table", "index", "row", "col", "box", "geometry", "source", "edited", "_value", "_mask")
+
+    def __init__(self, val, geometry=STANDARD):
+        if isinstance(val, int):
+            value = val if 0 < val <= geometry.size else 0
+        else:
+            value = geometry.symbolValues[ord(val)] if len(str(val)) == 1 and ord(val) < 256 else 0
+        self.table = None
+        self.index = None
+        self.row = None
+        self.col = None
+        self.box = None
+        self.geometry = geometry
+        self.source = val
+        self.edited = False
+        self._value = value
+        self._mask = geometry.digitBit[value] if value else geometry.allCandidates
+
+    def rebuild(self, geometry):
+        if self.geometry is geometry:
+            return
+        if self.table is not None or self.edited:
+            raise ValueError("Cell built for a %dx%d board cannot join a %dx%d one" %
+                             (self.geometry.size, self.geometry.size, geometry.size, geometry.size))
+        self.__init__(self.source, geometry)
+
+    @classmethod
+    def view(cls, table, index):
+        cell = cls.__new__(cls)
+        cell.bind(table, index)
+        return cell
+
+    def bind(self, table, index):
+        geometry = table.geometry
+        self.geometry = geometry
+        self.table = table
+        self.index = index
+        self.row = geometry.rowOf[index]
+        self.col = geometry.colOf[index]
+        self.box = geometry.boxOf[index]
+
+    @property
+    def value(self):
+        if self.table is None:
+            return self._value
+        return self.table.values[self.index]
+
+    @value.setter
+    def value(self, value):
+        if self.table is None:
+            self._value = value
+            self.edited = True
+        else:
+            self.table.values[self.index] = value
+            self.table.changed(self.index)
+
+    @property
+    def mask(self):
+        if self.table is None:
+            return self._mask
+        return self.table.masks[self.index]
+
+    @mask.setter
+    def mask(self, mask):
+        if self.table is None:
+            self._mask = mask
+            self.edited = True
+        else:
+            self.table.masks[self.index] = mask
+            self.table.changed(self.index)
+
+    @property
+    def candidates(self):
+        mask = self.mask
+        return CandidateList(self, [d for d in range(1, mask.bit_length() + 1) if mask >> (d - 1) & 1])
+
+    @candidates.setter
+    def candidates(self, candidates):
+        mask = 0
+        for num in candidates:
+            mask |= 1 << (num - 1)
+        self.mask = mask
 
     def hasSingleCandidate(self):
-        return len(self.candidates) == 1
+        mask = self.mask
+        return mask != 0 and mask & (mask - 1) == 0
+
+
+Step = namedtuple("Step", ["technique", "unit", "digits", "eliminations", "placements"])
+
+
+class StepLog:
+    # Structured trace of a solve. Eliminations and placements are collected as (cell index, digit) pairs until the
+    # technique that caused them records its step.
+    def __init__(self):
+        self.steps = []
+        self.eliminations = []
+        self.placements = []
+
+    def eliminated(self, index, mask):
+        while mask:
+            low = mask & -mask
+            self.eliminations.append((index, low.bit_length()))
+            mask ^= low
+
+    def placed(self, index, value):
+        self.placements.append((index, value))
+
+    def record(self, technique, unit, digits):
+        self.steps.append(Step(technique, unit, tuple(digits), self.eliminations, self.placements))
+        self.eliminations = []
+        self.placements = []
+
+    def __iter__(self):
+        return iter(self.steps)
+
+    def __len__(self):
+        return len(self.steps)
+
+
+class SolveMetrics:
+    # Counters for a Table with metrics enabled: per technique the calls, candidates eliminated, cells placed and
+    # nanoseconds spent, and for the searches the nodes visited, backtracks and deepest level reached. One instance
+    # can be shared by many tables to total up a batch.
+    def __init__(self):
+        self.techniques = {}
+        self.searches = 0
+        self.nodes = 0
+        self.backtracks = 0
+        self.maxDepth = 0
+
+    def technique(self, name, elapsed, eliminations, placements):
+        counts = self.techniques.get(name)
+        if counts is None:
+            counts = self.techniques[name] = [0, 0, 0, 0]
+        counts[0] += 1
+        counts[1] += eliminations
+        counts[2] += placements
+        counts[3] += elapsed
+
+    def searched(self, nodes, backtracks, depth):
+        self.searches += 1
+        self.nodes += nodes
+        self.backtracks += backtracks
+        self.maxDepth = max(self.maxDepth, depth)
+
+    def node(self, depth):
+        # For recursive searches, which count as they go rather than all at once.
+        self.nodes += 1
+        if depth > self.maxDepth:
+            self.maxDepth = depth
+
+    def merge(self, other):
+        for name, (calls, eliminations, placements, elapsed) in other.techniques.items():
+            counts = self.techniques.setdefault(name, [0, 0, 0, 0])
+            counts[0] += calls
+            counts[1] += eliminations
+            counts[2] += placements
+            counts[3] += elapsed
+        self.searches += other.searches
+        self.nodes += other.nodes
+        self.backtracks += other.backtracks
+        self.maxDepth = max(self.maxDepth, other.maxDepth)
+
+    def asDict(self):
+        return {
+            "techniques": {name: {"calls": calls, "eliminations": eliminations, "placements": placements,
+                                  "seconds": elapsed / 1e9}
+                           for name, (calls, eliminations, placements, elapsed) in self.techniques.items()},
+            "search": {"searches": self.searches, "nodes": self.nodes, "backtracks": self.backtracks,
+                       "maxDepth": self.maxDepth},
+        }
+
+    def toPrometheus(self, prefix="sudoku"):
+        # Text exposition format, one family per counter.
+        lines = []
+        families = [("technique_calls_total", "counter", "Technique runs.", 0, 1),
+                    ("technique_eliminations_total", "counter", "Candidates eliminated by a technique.", 1, 1),
+                    ("technique_placements_total", "counter", "Cells placed by a technique.", 2, 1),
+                    ("technique_seconds_total", "counter", "Time spent in a technique.", 3, 1e9)]
+        for name, kind, help, field, scale in families:
+            lines.append("# HELP %s_%s %s" % (prefix, name, help))
+            lines.append("# TYPE %s_%s %s" % (prefix, name, kind))
+            for technique, counts in sorted(self.techniques.items()):
+                value = counts[field] / scale if scale != 1 else counts[field]
+                lines.append('%s_%s{technique="%s"} %s' % (prefix, name, technique, value))
+        for name, kind, help, value in [("searches_total", "counter", "Searches run.", self.searches),
+                                        ("search_nodes_total", "counter", "Search nodes visited.", self.nodes),
+                                        ("search_backtracks_total", "counter", "Search backtracks.", self.backtracks),
+                                        ("search_max_depth", "gauge", "Deepest search level reached.", self.maxDepth)]:
+            lines.append("# HELP %s_%s %s" % (prefix, name, help))
+            lines.append("# TYPE %s_%s %s" % (prefix, name, kind))
+            lines.append("%s_%s %s" % (prefix, name, value))
+        return "\n".join(lines) + "\n"
+
+
+class TechniqueScheduler:
+    # Orders deductive techniques by their recent yield (candidates eliminated plus cells placed) per nanosecond,
+    # tracked as exponentially weighted averages. Techniques that have not run yet keep their default position.
+    # One scheduler can be shared by many tables so that a batch keeps learning from puzzle to puzzle.
+    def __init__(self, defaultOrder=tuple(range(1, 15)), decay=0.3):
+        self.defaultOrder = list(defaultOrder)
+        self.decay = decay
+        self.cost = {}
+        self.gain = {}
+
+    def order(self):
+        untried = [t for t in self.defaultOrder if t not in self.cost]
+        tried = [t for t in self.defaultOrder if t in self.cost]
+        tried.sort(key=lambda t: self.gain[t] / self.cost[t], reverse=True)
+        return untried + tried
+
+    def update(self, technique, elapsed, changes):
+        elapsed = max(elapsed, 1)
+        if technique not in self.cost:
+            self.cost[technique] = float(elapsed)
+            self.gain[technique] = float(changes)
+        else:
+            self.cost[technique] += self.decay * (elapsed - self.cost[technique])
+            self.gain[technique] += self.decay * (changes - self.gain[technique])
+
+
+class OrderProfile:
+    # The fastest deductiveSolve order for each tier of puzzles, as measured by SudokuTuner. Puzzles fall into tiers
+    # by their clue count and by their candidate count once the givens are struck from their peers, both of which
+    # cost a single pass over the board. An order is a fixed order number or a list of technique numbers.
+    def __init__(self, clueBounds=(), candidateBounds=(), orders=None, default=1):
+        self.clueBounds = list(clueBounds)
+        self.candidateBounds = list(candidateBounds)
+        self.orders = dict(orders or {})
+        self.default = default
+
+    @staticmethod
+    def features(table):
+        g = table.geometry
+        seen = [0] * len(g.units)
+        for u, unit in enumerate(g.units):
+            for i in unit:
+                if table.values[i]:
+                    seen[u] |= g.digitBit[table.values[i]]
+        clues = candidates = 0
+        for i in range(g.cells):
+            if table.values[i]:
+                clues += 1
+            else:
+                row, col, box = g.cellUnits[i]
+                candidates += g.popcount[table.masks[i] & ~(seen[row] | seen[col] | seen[box])]
+        return clues, candidates
+
+    def tier(self, clues, candidates):
+        import bisect
+        return "%d,%d" % (bisect.bisect_right(self.clueBounds, clues),
+                          bisect.bisect_right(self.candidateBounds, candidates))
+
+    def orderFor(self, table):
+        return self.orders.get(self.tier(*self.features(table)), self.default)
+
+    def asDict(self):
+        return {"clueBounds": self.clueBounds, "candidateBounds": self.candidateBounds, "orders": self.orders,
+                "default": self.default}
+
+    @classmethod
+    def fromDict(cls, data):
+        return cls(data["clueBounds"], data["candidateBounds"], data["orders"], data.get("default", 1))
+
+    @classmethod
+    def load(cls, path):
+        import json
+        with open(path) as file:
+            return cls.fromDict(json.load(file))
+
+
+# Where order="auto" looks for a profile; without one it uses the first fixed order.
+DEFAULT_PROFILE = "SudokuProfile.json"
+profiles = {}
+
+
+def defaultProfile(path=DEFAULT_PROFILE):
+    # Loaded once per process; a missing file gives an empty profile.
+    profile = profiles.get(path)
+    if profile is None:
+        profile = profiles[path] = OrderProfile.load(path) if os.path.exists(path) else OrderProfile()
+    return profile
 
 
 class Table:
+    # The board state is the flat values list and masks array; Cell views are only created if self.cells is used.
     def __init__(self, initcells):
-        self.cells = initcells
+        self.geometry = geometryFor(boxSizeFor(len(initcells)))
+        for cell in initcells:
+            cell.rebuild(self.geometry)
+        self.setState([cell.value for cell in initcells], array(self.geometry.maskType, [cell.mask for cell in initcells]))
+        self._cells = initcells
+        for index, cell in enumerate(initcells):
+            cell.bind(self, index)
+
+    def setState(self, values, masks):
+        self.values = values
+        self.masks = masks
+        self.propagating = False
+        self.singlesQueue = []
+        self.log = None
+        self.metrics = None
+        self.changes = 0
+        self.timedOut = False
+        self.unitVersions = array("L", [0] * len(self.geometry.units))
+        self.seenVersions = {}
+        self._cells = None
+
+    @property
+    def cells(self):
+        if self._cells is None:
+            self._cells = [Cell.view(self, index) for index in range(self.geometry.cells)]
+        return self._cells
+
+    @classmethod
+    def fromString(cls, puzzle, n=None, symbols=None):
+        # Symbols in row-major order as str or bytes, with "." for blanks; whitespace is ignored. The box size is
+        # taken from the cell count (81, 256 or 625) unless n is given.
+        if isinstance(puzzle, str):
+            puzzle = puzzle.encode("ascii")
+        if len(puzzle) not in (81, 256, 625) or n is not None and len(puzzle) != n ** 4:
+            puzzle = b"".join(bytes(puzzle).split())
+        if n is None:
+            n = boxSizeFor(len(puzzle))
+        elif len(puzzle) != n ** 4:
+            raise ValueError("Expected " + str(n ** 4) + " cells, got " + str(len(puzzle)))
+        geometry = geometryFor(n, symbols)
+        table = cls.__new__(cls)
+        table.geometry = geometry
+        table.setState(list(bytes(puzzle).translate(geometry.symbolValues)),
+                       array(geometry.maskType, [geometry.symbolMasks[b] for b in puzzle]))
+        return table
+
+    fromBytes = fromString
+
+    @classmethod
+    def fromValues(cls, values, n=None):
+        # Cell values in row-major order with 0 for blanks, skipping the symbol parsing of fromString.
+        geometry = geometryFor(n if n is not None else boxSizeFor(len(values)))
+        table = cls.__new__(cls)
+        table.geometry = geometry
+        table.setState(list(values), array(geometry.maskType, [geometry.digitBit[value] or geometry.allCandidates
+                                                               for value in values]))
+        return table
+
+    def copy(self):
+        table = self.__class__.__new__(self.__class__)
+        table.geometry = self.geometry
+        table.setState(self.values[:], self.masks[:])
+        table.propagating = self.propagating
+        table.singlesQueue = self.singlesQueue[:]
+        return table
+
+    def toString(self):
+        symbols = "." + self.geometry.symbols
+        return "".join(symbols[value] for value in self.values)
 
     def __str__(self):
+        return self.boardString()
+
+    def boardString(self, marked=None):
+        # The board as a grid, with "_" standing in for the cell at index marked, if any.
+        symbols = " " + self.geometry.symbols
+        size = self.geometry.size
         ret = ""
-        for cell in self.cells:
-            val = str(cell.value) if cell.value != 0 else " "
+        for i, value in enumerate(self.values):
+            val = "_" if i == marked else symbols[value]
             ret += val + " "
-            if (self.cells.index(cell) + 1) % 9 == 0:
+            if (i + 1) % size == 0:
                 ret = ret[:-1] + "\n"
         if ret.endswith("\n"):
             ret = ret[:-1]
         return ret
 
+    def digitString(self, digits):
+        # A list of digits, or of lists of digits, as receipts print it, with each digit as its board symbol.
+        return "[" + ", ".join(self.geometry.symbols[d - 1] if isinstance(d, int) else self.digitString(d)
+                               for d in digits) + "]"
+
     def rowCells(self, row):
-        return self.cells[row * 9:row * 9 + 9]
+        return [self.cells[i] for i in self.geometry.rowIndices[row]]
 
     def colCells(self, col):
-        return self.cells[col::9]
+        return [self.cells[i] for i in self.geometry.colIndices[col]]
 
     def boxCells(self, box):
-        return self.cells[(box // 3) * 27 + (box % 3) * 3:(box // 3) * 27 + (box % 3) * 3 + 3] + \
-               self.cells[(box // 3) * 27 + (box % 3) * 3 + 9:(box // 3) * 27 + (box % 3) * 3 + 12] + \
-               self.cells[(box // 3) * 27 + (box % 3) * 3 + 18:(box // 3) * 27 + (box % 3) * 3 + 21]
+        return [self.cells[i] for i in self.geometry.boxIndices[box]]
+
+    def peerCells(self, cell):
+        return [self.cells[i] for i in self.geometry.peers[cell.index]]
 
     def cellsLeft(self):
         return [x for x in self.cells if x.value == 0]
 
     def numCandidatesLeft(self):
-        candidatesLeft = [x.candidates for x in self.cellsLeft()]
+        values = self.values
+        masks = self.masks
+        popcount = self.geometry.popcount
         numCandidatesLeft = 0
-        for candidates in candidatesLeft:
-            numCandidatesLeft += len(candidates)
+        for i in range(self.geometry.cells):
+            if values[i] == 0:
+                numCandidatesLeft += popcount[masks[i]]
         return numCandidatesLeft
 
     def checkSameBox(self, icell, jcell):
-        i = self.cells.index(icell)
-        j = self.cells.index(jcell)
-        irow = i // 9
-        jrow = j // 9
-        icol = i % 9
-        jcol = j % 9
-        return (irow // 3 == jrow // 3) and (icol // 3 == jcol // 3)
+        return icell.box == jcell.box
 
     def cellCausesError(self, cell, filledCells=None):
+        value = cell.value
         if filledCells is None:
-            filledCells = [x for x in self.cells if x.value != 0]
-        error = False
-        c = self.cells.index(cell)
-        crow = c // 9
-        ccol = c % 9
+            values = self.values
+            for p in self.geometry.peers[cell.index]:
+                if values[p] == value:
+                    return True
+            return False
+        peerSet = self.geometry.peerSets[cell.index]
         for fcell in filledCells:
-            f = self.cells.index(fcell)
-            frow = f // 9
-            fcol = f % 9
-            if (crow == frow or ccol == fcol or self.checkSameBox(cell, fcell)) and cell.value == fcell.value:
-                error = True
-                break
-        return error
+            if fcell.index in peerSet and fcell.value == value:
+                return True
+        return False
 
     def removeImpossibleCandidates(self, cell, printReceipt=True):
-        receipt = ""
-        c = self.cells.index(cell)
-        crow = c // 9
-        ccol = c % 9
-        filledCells = [x for x in self.cells if x.value != 0]
-        for fcell in filledCells:
-            f = self.cells.index(fcell)
-            frow = f // 9
-            fcol = f % 9
-            if (crow == frow or
-                ccol == fcol or
-                self.checkSameBox(cell, fcell)) and \
-                    fcell.value in cell.candidates:
-                cell.candidates.remove(fcell.value)
-        receipt += "Row " + str(crow + 1) + " Column " + str(ccol + 1) + " " + str(cell.candidates) + "\n"
-        if printReceipt and receipt:
-            print(receipt, end="")
+        g = self.geometry
+        c = cell.index
+        values = self.values
+        seen = 0
+        for p in g.peers[c]:
+            seen |= g.digitBit[values[p]]
+        if self.log is not None and self.masks[c] & seen:
+            self.log.eliminated(c, self.masks[c] & seen)
+            self.log.record("Peer Elimination", ("Cell", (g.rowOf[c] + 1, g.colOf[c] + 1)), g.maskDigits[self.masks[c] & seen])
+        if self.masks[c] & seen:
+            self.masks[c] &= ~seen
+            self.changed(c)
+        if printReceipt:
+            print("Row " + str(g.rowOf[c] + 1) + " Column " + str(g.colOf[c] + 1) + " " +
+                  self.digitString(cell.candidates))
+
+    def measure(self, function, *args):
+        # Runs a technique, charging it to self.metrics if enabled. Eliminations are the drop in the total number of
+        # candidate bits, placements the drop in empty cells; neither is counted in the techniques themselves.
+        metrics = self.metrics
+        if metrics is None:
+            return function(*args)
+        popcount = self.geometry.popcount
+        candidates = sum(popcount[mask] for mask in self.masks)
+        empty = self.values.count(0)
+        start = time.perf_counter_ns()
+        result = function(*args)
+        elapsed = time.perf_counter_ns() - start
+        metrics.technique(function.__name__, elapsed, candidates - sum(popcount[mask] for mask in self.masks),
+                          empty - self.values.count(0))
+        return result
+
+    def changed(self, index):
+        # Every candidate or value change bumps the change counter and the versions of the cell's three units.
+        self.changes += 1
+        versions = self.unitVersions
+        for unit in self.geometry.cellUnits[index]:
+            versions[unit] += 1
+
+    def unitsSeen(self, technique):
+        # The unit versions a technique last examined; a unit whose version still matches cannot yield anything new.
+        seen = self.seenVersions.get(technique)
+        if seen is None:
+            seen = self.seenVersions[technique] = array("q", [-1] * len(self.geometry.units))
+        return seen
+
+    def eliminate(self, index, mask):
+        old = self.masks[index]
+        if old & mask:
+            if self.log is not None:
+                self.log.eliminated(index, old & mask)
+            old &= ~mask
+            self.masks[index] = old
+            self.changed(index)
+            if self.propagating and old and not old & (old - 1):
+                self.singlesQueue.append(index)
+            return True
+        return False
+
+    def place(self, index, value):
+        # Fill a cell and strike its value from the empty peers, queueing any that are left with one candidate.
+        bit = 1 << (value - 1)
+        values = self.values
+        masks = self.masks
+        log = self.log
+        if log is not None:
+            log.placed(index, value)
+        values[index] = value
+        masks[index] = bit
+        self.changed(index)
+        for p in self.geometry.peers[index]:
+            mask = masks[p]
+            if mask & bit and values[p] == 0:
+                if log is not None:
+                    log.eliminated(p, bit)
+                mask &= ~bit
+                masks[p] = mask
+                self.changed(p)
+                if mask and not mask & (mask - 1):
+                    self.singlesQueue.append(p)
+
+    def startPropagating(self):
+        # One full elimination pass; from here on every placement updates its peers as it happens.
+        g = self.geometry
+        values = self.values
+        masks = self.masks
+        for i in range(g.cells):
+            if values[i] == 0:
+                seen = 0
+                for p in g.peers[i]:
+                    seen |= g.digitBit[values[p]]
+                if masks[i] & seen:
+                    if self.log is not None:
+                        self.log.eliminated(i, masks[i] & seen)
+                    masks[i] &= ~seen
+                    self.changed(i)
+                if g.popcount[masks[i]] == 1:
+                    self.singlesQueue.append(i)
+        if self.log is not None:
+            self.log.record("Peer Elimination", None, ())
+        self.propagating = True
+
+    def propagate(self, printReceipt=True):
+        g = self.geometry
+        values = self.values
+        masks = self.masks
+        queue = self.singlesQueue
+        while queue:
+            i = queue.pop()
+            if values[i] == 0 and g.popcount[masks[i]] == 1:
+                self.place(i, g.lowestDigit[masks[i]])
+                if printReceipt:
+                    print("Row " + str(g.rowOf[i] + 1) + " Column " + str(g.colOf[i] + 1) + " " +
+                          self.digitString([values[i]]))
+                if self.log is not None:
+                    self.log.record("Naked Single", ("Cell", (g.rowOf[i] + 1, g.colOf[i] + 1)), (values[i],))
 
     def findNakedSingles(self, printReceipt=True):
-        receipt = ""
-        for cell in self.cellsLeft():
-            c = self.cells.index(cell)
-            row = c // 9
-            col = c % 9
-            if cell.hasSingleCandidate():
-                cell.value = cell.candidates[0]
-                receipt += "Row " + str(row + 1) + " Column " + str(col + 1) + " " + str(cell.candidates) + "\n"
-        if printReceipt and receipt:
-            print(receipt, end="")
+        g = self.geometry
+        values = self.values
+        masks = self.masks
+        for i in range(g.cells):
+            if values[i] == 0 and g.popcount[masks[i]] == 1:
+                if self.propagating:
+                    self.place(i, g.lowestDigit[masks[i]])
+                else:
+                    values[i] = g.lowestDigit[masks[i]]
+                    self.changed(i)
+                    if self.log is not None:
+                        self.log.placed(i, values[i])
+                if printReceipt:
+                    print("Row " + str(g.rowOf[i] + 1) + " Column " + str(g.colOf[i] + 1) + " " +
+                          self.digitString([values[i]]))
+                if self.log is not None:
+                    self.log.record("Naked Single", ("Cell", (g.rowOf[i] + 1, g.colOf[i] + 1)), (values[i],))
 
     def findHiddenSingles(self, printReceipt=True):
-        receipt = ""
-        for type in range(3):
+        g = self.geometry
+        values = self.values
+        masks = self.masks
+        log = self.log
+        versions = self.unitVersions
+        seen = self.unitsSeen("findHiddenSingles")
+        for groupName, groups, offset in g.groups:
             removed = False
-            for group in range(9):
-                groupName = ""
-                groupCells = []
-                if type == 0:
-                    groupName = "Row"
-                    groupCells = self.rowCells(group)
-                if type == 1:
-                    groupName = "Column"
-                    groupCells = self.colCells(group)
-                if type == 2:
-                    groupName = "Box"
-                    groupCells = self.boxCells(group)
-                emptyCellCandidatesInGroup = [x.candidates for x in groupCells if x.value == 0]
-                counts = {}
-                for candidates in emptyCellCandidatesInGroup:
-                    for num in candidates:
-                        if num not in counts:
-                            counts[num] = 0
-                        counts[num] += 1
-                singles = [x for x in counts if counts[x] == 1]
+            for group in range(g.size):
+                unit = offset + group
+                if seen[unit] == versions[unit]:
+                    continue
+                seen[unit] = versions[unit]
+                emptyCells = [i for i in groups[group] if values[i] == 0]
+                once = twice = 0
+                for i in emptyCells:
+                    twice |= once & masks[i]
+                    once |= masks[i]
+                singles = once & ~twice
                 if singles:
-                    emptyCells = [x for x in groupCells if x.value == 0]
-                    for single in singles:
-                        for cell in emptyCells:
-                            if single in cell.candidates:
-                                cell.candidates = [single]
-                                cell.value = single
-                    receipt += groupName + " " + str(group + 1) + " " + str(singles) + "\n"
+                    for i in emptyCells:
+                        hit = masks[i] & singles
+                        if hit:
+                            single = g.lowestDigit[hit]
+                            if self.propagating:
+                                self.place(i, single)
+                            else:
+                                if log is not None:
+                                    log.eliminated(i, masks[i] & ~g.digitBit[single])
+                                    log.placed(i, single)
+                                masks[i] = g.digitBit[single]
+                                values[i] = single
+                                self.changed(i)
+                    if printReceipt:
+                        print(groupName + " " + str(group + 1) + " " + self.digitString(g.maskDigits[singles]))
+                    if log is not None:
+                        log.record("Hidden Single", (groupName, group + 1), g.maskDigits[singles])
                     removed = True
             if removed:
                 break
-        if printReceipt and receipt:
-            print(receipt, end="")
 
     def findNakedPairs(self, printReceipt=True):
-        receipt = ""
-        for type in range(3):
-            for group in range(9):
-                groupName = ""
-                groupCells = []
-                if type == 0:
-                    groupName = "Row"
-                    groupCells = self.rowCells(group)
-                if type == 1:
-                    groupName = "Column"
-                    groupCells = self.colCells(group)
-                if type == 2:
-                    groupName = "Box"
-                    groupCells = self.boxCells(group)
-                emptyCells = [x for x in groupCells if x.value == 0]
+        g = self.geometry
+        values = self.values
+        masks = self.masks
+        versions = self.unitVersions
+        seen = self.unitsSeen("findNakedPairs")
+        for groupName, groups, offset in g.groups:
+            for group in range(g.size):
+                unit = offset + group
+                if seen[unit] == versions[unit]:
+                    continue
+                seen[unit] = versions[unit]
+                emptyCells = [i for i in groups[group] if values[i] == 0]
                 pairs = []
                 if len(emptyCells) >= 2:
-                    for icell in emptyCells:
-                        if len(icell.candidates) == 2:
-                            ie = emptyCells.index(icell)
-                            for jcell in emptyCells[ie + 1:]:
-                                if icell.candidates == jcell.candidates:
+                    for ie, i in enumerate(emptyCells):
+                        pairMask = masks[i]
+                        if g.popcount[pairMask] == 2:
+                            for j in emptyCells[ie + 1:]:
+                                if masks[j] == pairMask:
                                     removed = False
-                                    for cell in emptyCells:
-                                        if cell is not icell and cell is not jcell:
-                                            before = cell.candidates[:]
-                                            cell.candidates = [x for x in cell.candidates if x not in icell.candidates]
-                                            after = cell.candidates[:]
-                                            if before != after:
-                                                removed = True
+                                    for k in emptyCells:
+                                        if k != i and k != j and self.eliminate(k, pairMask):
+                                            removed = True
                                     if removed:
-                                        pairs.append(icell.candidates)
-                if pairs:
-                    receipt += groupName + " " + str(group + 1) + " " + str(pairs) + "\n"
-        if printReceipt and receipt:
-            print(receipt, end="")
+                                        pairs.append(list(g.maskDigits[pairMask]))
+                                        if self.log is not None:
+                                            self.log.record("Naked Pair", (groupName, group + 1), g.maskDigits[pairMask])
+                if pairs and printReceipt:
+                    print(groupName + " " + str(group + 1) + " " + self.digitString(pairs))
 
     def findHiddenPairs(self, printReceipt=True):
-        receipt = ""
-        for type in range(3):
-            for group in range(9):
-                groupName = ""
-                groupCells = []
-                if type == 0:
-                    groupName = "Row"
-                    groupCells = self.rowCells(group)
-                if type == 1:
-                    groupName = "Column"
-                    groupCells = self.colCells(group)
-                if type == 2:
-                    groupName = "Box"
-                    groupCells = self.boxCells(group)
-                emptyCellCandidatesInGroup = [x.candidates for x in groupCells if x.value == 0]
-                counts = {}
-                for candidates in emptyCellCandidatesInGroup:
-                    for num in candidates:
-                        if num not in counts:
-                            counts[num] = 0
-                        counts[num] += 1
-                doubles = [x for x in counts if counts[x] == 2]
-                if doubles:
-                    emptyCells = [x for x in groupCells if x.value == 0]
-                    for double1 in doubles[:]:
-                        di = doubles.index(double1)
-                        pair = []
-                        for cell in emptyCells:
-                            if double1 in cell.candidates:
-                                pair.append(cell)
-                        if len(pair) == 2 and len(pair[0].candidates + pair[1].candidates) > 4:
-                            for double2 in doubles[di + 1:]:
-                                if double2 in pair[0].candidates and double2 in pair[1].candidates:
-                                    nakedPair = [double1, double2]
-                                    pair[0].candidates = nakedPair[:]
-                                    pair[1].candidates = nakedPair[:]
-                                    receipt += groupName + " " + str(group + 1) + " " + str(nakedPair) + "\n"
-        if printReceipt and receipt:
-            print(receipt, end="")
+        g = self.geometry
+        values = self.values
+        masks = self.masks
+        log = self.log
+        versions = self.unitVersions
+        seen = self.unitsSeen("findHiddenPairs")
+        for groupName, groups, offset in g.groups:
+            for group in range(g.size):
+                unit = offset + group
+                if seen[unit] == versions[unit]:
+                    continue
+                seen[unit] = versions[unit]
+                emptyCells = [i for i in groups[group] if values[i] == 0]
+                once = twice = more = 0
+                for i in emptyCells:
+                    more |= twice & masks[i]
+                    twice |= once & masks[i]
+                    once |= masks[i]
+                doubles = g.maskDigits[twice & ~more]
+                for di, double1 in enumerate(doubles):
+                    pair = [i for i in emptyCells if masks[i] & g.digitBit[double1]]
+                    if len(pair) == 2 and g.popcount[masks[pair[0]]] + g.popcount[masks[pair[1]]] > 4:
+                        for double2 in doubles[di + 1:]:
+                            if masks[pair[0]] & masks[pair[1]] & g.digitBit[double2]:
+                                pairMask = g.digitBit[double1] | g.digitBit[double2]
+                                if log is not None:
+                                    log.eliminated(pair[0], masks[pair[0]] & ~pairMask)
+                                    log.eliminated(pair[1], masks[pair[1]] & ~pairMask)
+                                    log.record("Hidden Pair", (groupName, group + 1), (double1, double2))
+                                masks[pair[0]] = pairMask
+                                masks[pair[1]] = pairMask
+                                self.changed(pair[0])
+                                self.changed(pair[1])
+                                if printReceipt:
+                                    print(groupName + " " + str(group + 1) + " " + self.digitString([double1, double2]))
 
     def findPointingPairs(self, printReceipt=True):
         self.findPointingPairsByRow(printReceipt)
         self.findPointingPairsByCol(printReceipt)
 
     def findPointingPairsByRow(self, printReceipt=True):
-        receipt = ""
-        for row in range(9):
-            rowCells = self.rowCells(row)
-            emptyCellCandidatesInRow = [x.candidates for x in rowCells if x.value == 0]
-            counts = {}
-            for candidates in emptyCellCandidatesInRow:
-                for num in candidates:
-                    if num not in counts:
-                        counts[num] = 0
-                    counts[num] += 1
-            pairNums = [x for x in counts if counts[x] == 2]
-            emptyCellsInRow = [x for x in rowCells if x.value == 0]
-            for pairNum in pairNums[:]:
-                pair = []
-                for emptyCellInRow in emptyCellsInRow:
-                    if pairNum in emptyCellInRow.candidates:
-                        pair.append(emptyCellInRow)
-                i = self.cells.index(pair[0])
-                icol = i % 9
-                if self.checkSameBox(pair[0], pair[1]):
-                    box = row // 3 * 3 + icol // 3
-                    boxCells = self.boxCells(box)
-                    emptyCellsInBox = [x for x in boxCells if x.value == 0]
-                    removed = False
-                    for emptyCellInBox in emptyCellsInBox:
-                        if emptyCellInBox not in pair and pairNum in emptyCellInBox.candidates:
-                            emptyCellInBox.candidates.remove(pairNum)
-                            removed = True
-                    if not removed:
-                        pairNums.remove(pairNum)
-                else:
-                    pairNums.remove(pairNum)
-            if pairNums:
-                receipt += "Row " + str(row + 1) + " " + str(pairNums) + "\n"
-        if printReceipt and receipt:
-            print(receipt, end="")
+        g = self.geometry
+        self.findPointingPairsInLines("Row", g.rowIndices, 0, printReceipt)
 
     def findPointingPairsByCol(self, printReceipt=True):
-        receipt = ""
-        for col in range(9):
-            colCells = self.colCells(col)
-            emptyCellCandidatesInCol = [x.candidates for x in colCells if x.value == 0]
-            counts = {}
-            for candidates in emptyCellCandidatesInCol:
-                for num in candidates:
-                    if num not in counts:
-                        counts[num] = 0
-                    counts[num] += 1
-            pairNums = [x for x in counts if counts[x] == 2]
-            emptyCellsInCol = [x for x in colCells if x.value == 0]
-            for pairNum in pairNums[:]:
-                pair = []
-                for emptyCellInCol in emptyCellsInCol:
-                    if pairNum in emptyCellInCol.candidates:
-                        pair.append(emptyCellInCol)
-                i = self.cells.index(pair[0])
-                irow = i // 9
-                if self.checkSameBox(pair[0], pair[1]):
-                    box = irow // 3 * 3 + col // 3
-                    boxCells = self.boxCells(box)
-                    emptyCellsInBox = [x for x in boxCells if x.value == 0]
+        g = self.geometry
+        self.findPointingPairsInLines("Column", g.colIndices, g.size, printReceipt)
+
+    def findPointingPairsInLines(self, lineName, lines, offset, printReceipt=True):
+        g = self.geometry
+        values = self.values
+        masks = self.masks
+        versions = self.unitVersions
+        seen = self.unitsSeen("findPointingPairs")
+        for line in range(g.size):
+            if seen[offset + line] == versions[offset + line]:
+                continue
+            seen[offset + line] = versions[offset + line]
+            emptyCellsInLine = [i for i in lines[line] if values[i] == 0]
+            once = twice = more = 0
+            for i in emptyCellsInLine:
+                more |= twice & masks[i]
+                twice |= once & masks[i]
+                once |= masks[i]
+            pairNums = []
+            for pairNum in g.maskDigits[twice & ~more]:
+                bit = g.digitBit[pairNum]
+                pair = [i for i in emptyCellsInLine if masks[i] & bit]
+                box = g.boxOf[pair[0]]
+                if box == g.boxOf[pair[1]]:
                     removed = False
-                    for emptyCellInBox in emptyCellsInBox:
-                        if emptyCellInBox not in pair and pairNum in emptyCellInBox.candidates:
-                            emptyCellInBox.candidates.remove(pairNum)
+                    for i in g.boxIndices[box]:
+                        if values[i] == 0 and i not in pair and self.eliminate(i, bit):
                             removed = True
-                    if not removed:
-                        pairNums.remove(pairNum)
-                else:
-                    pairNums.remove(pairNum)
-            if pairNums:
-                receipt += "Column " + str(col + 1) + " " + str(pairNums) + "\n"
-        if printReceipt and receipt:
-            print(receipt, end="")
+                    if removed:
+                        pairNums.append(pairNum)
+                        if self.log is not None:
+                            self.log.record("Pointing Pair", (lineName, line + 1), (pairNum,))
+            if pairNums and printReceipt:
+                print(lineName + " " + str(line + 1) + " " + self.digitString(pairNums))
 
     def findNakedTriples(self, printReceipt=True):
-        receipt = ""
-        for type in range(3):
-            for group in range(9):
-                groupName = ""
-                groupCells = []
-                if type == 0:
-                    groupName = "Row"
-                    groupCells = self.rowCells(group)
-                if type == 1:
-                    groupName = "Column"
-                    groupCells = self.colCells(group)
-                if type == 2:
-                    groupName = "Box"
-                    groupCells = self.boxCells(group)
-                emptyCells = [x for x in groupCells if x.value == 0]
+        g = self.geometry
+        values = self.values
+        masks = self.masks
+        versions = self.unitVersions
+        seen = self.unitsSeen("findNakedTriples")
+        for groupName, groups, offset in g.groups:
+            for group in range(g.size):
+                unit = offset + group
+                if seen[unit] == versions[unit]:
+                    continue
+                seen[unit] = versions[unit]
+                emptyCells = [i for i in groups[group] if values[i] == 0]
                 trips = []
                 if len(emptyCells) >= 3:
-                    for icell in emptyCells:
-                        if len(icell.candidates) <= 3:
-                            ie = emptyCells.index(icell)
-                            for jcell in emptyCells[ie + 1:]:
-                                if len(jcell.candidates) <= 3:
-                                    je = emptyCells.index(jcell)
-                                    for kcell in emptyCells[je + 1:]:
-                                        if len(kcell.candidates) <= 3:
-                                            iandj = list(set(icell.candidates + jcell.candidates))
-                                            iandk = list(set(icell.candidates + kcell.candidates))
-                                            jandk = list(set(jcell.candidates + kcell.candidates))
-                                            ijk = list(set(iandj + iandk + jandk))
-                                            if len(ijk) == 3:
+                    for ie, i in enumerate(emptyCells):
+                        if g.popcount[masks[i]] <= 3:
+                            for je in range(ie + 1, len(emptyCells)):
+                                j = emptyCells[je]
+                                if g.popcount[masks[j]] <= 3:
+                                    for k in emptyCells[je + 1:]:
+                                        if g.popcount[masks[k]] <= 3:
+                                            ijk = masks[i] | masks[j] | masks[k]
+                                            if g.popcount[ijk] == 3:
                                                 removed = False
                                                 for cell in emptyCells:
-                                                    if cell is not icell and cell is not jcell and cell is not kcell:
-                                                        before = cell.candidates[:]
-                                                        cell.candidates = [x for x in cell.candidates if x not in ijk]
-                                                        after = cell.candidates[:]
-                                                        if before != after:
-                                                            removed = True
+                                                    if cell != i and cell != j and cell != k and \
+                                                            self.eliminate(cell, ijk):
+                                                        removed = True
                                                 if removed:
-                                                    trips.append(ijk)
-                if trips:
-                    receipt += groupName + " " + str(group + 1) + " " + str(trips) + "\n"
-        if printReceipt and receipt:
-            print(receipt, end="")
+                                                    trips.append(list(g.maskDigits[ijk]))
+                                                    if self.log is not None:
+                                                        self.log.record("Naked Triple", (groupName, group + 1),
+                                                                        g.maskDigits[ijk])
+                if trips and printReceipt:
+                    print(groupName + " " + str(group + 1) + " " + self.digitString(trips))
 
     def findXWings(self, printReceipt=True):
         self.findXWingsByRow(printReceipt)
         self.findXWingsByCol(printReceipt)
 
     def findXWingsByRow(self, printReceipt=True):
-        receipt = ""
-        xWingNums = {}
-        for row in range(9):
-            rowCells = self.rowCells(row)
-            emptyCellCandidatesInRow = [x.candidates for x in rowCells if x.value == 0]
-            rowCounts = {}
-            for candidates in emptyCellCandidatesInRow:
-                for num in candidates:
-                    if num not in rowCounts:
-                        rowCounts[num] = 0
-                    rowCounts[num] += 1
-            pairNums = [x for x in rowCounts if rowCounts[x] == 2]
-            emptyCellsInRow = [x for x in rowCells if x.value == 0]
-            for pairNum in pairNums[:]:
-                pair = []
-                for emptyCellInRow in emptyCellsInRow:
-                    if pairNum in emptyCellInRow.candidates:
-                        pair.append(emptyCellInRow)
-                if pairNum not in xWingNums:
-                    xWingNums[pairNum] = []
-                xWingNums[pairNum].append(pair)
-        for xWingNum in dict(xWingNums):
-            if len(xWingNums[xWingNum]) < 2:
-                del xWingNums[xWingNum]
-            else:
-                for pair1 in xWingNums[xWingNum]:
-                    pair1i = xWingNums[xWingNum].index(pair1)
-                    row1 = self.cells.index(pair1[0]) // 9
-                    icol1 = self.cells.index(pair1[0]) % 9
-                    jcol1 = self.cells.index(pair1[1]) % 9
-                    for pair2 in xWingNums[xWingNum][pair1i + 1:]:
-                        row2 = self.cells.index(pair2[0]) // 9
-                        icol2 = self.cells.index(pair2[0]) % 9
-                        jcol2 = self.cells.index(pair2[1]) % 9
-                        if icol1 == icol2 and jcol1 == jcol2:
-                            removed = False
-                            emptyCellsInICol = [x for x in self.colCells(icol1) if x.value == 0 and x not in pair1 and x not in pair2]
-                            emptyCellsInJCol = [x for x in self.colCells(jcol1) if x.value == 0 and x not in pair1 and x not in pair2]
-                            emptyCellsInIJCols = emptyCellsInICol + emptyCellsInJCol
-                            for emptyCellInIJCols in emptyCellsInIJCols:
-                                if xWingNum in emptyCellInIJCols.candidates:
-                                    emptyCellInIJCols.candidates.remove(xWingNum)
-                                    removed = True
-                            if removed:
-                                receipt += "Rows " + str(row1 + 1) + " and " + str(row2 + 1) + " [" + str(xWingNum) + "]\n"
-        if printReceipt and receipt:
-            print(receipt, end="")
+        g = self.geometry
+        self.findXWingsInLines("Rows", g.rowIndices, g.colIndices, 0, printReceipt)
 
     def findXWingsByCol(self, printReceipt=True):
-        receipt = ""
+        g = self.geometry
+        self.findXWingsInLines("Columns", g.colIndices, g.rowIndices, g.size, printReceipt)
+
+    def findXWingsInLines(self, linesName, lines, crossLines, offset, printReceipt=True):
+        # A line holding a digit in exactly two cells is recorded by the positions of those cells in the line.
+        # Patterns span lines, so the search is skipped only when none of the lines changed.
+        g = self.geometry
+        values = self.values
+        masks = self.masks
+        versions = self.unitVersions
+        seen = self.unitsSeen("findXWings")
+        if all(seen[unit] == versions[unit] for unit in range(offset, offset + g.size)):
+            return
+        for unit in range(offset, offset + g.size):
+            seen[unit] = versions[unit]
         xWingNums = {}
-        for col in range(9):
-            colCells = self.colCells(col)
-            emptyCellCandidatesInCol = [x.candidates for x in colCells if x.value == 0]
-            colCounts = {}
-            for candidates in emptyCellCandidatesInCol:
-                for num in candidates:
-                    if num not in colCounts:
-                        colCounts[num] = 0
-                    colCounts[num] += 1
-            pairNums = [x for x in colCounts if colCounts[x] == 2]
-            emptyCellsInCol = [x for x in colCells if x.value == 0]
-            for pairNum in pairNums[:]:
-                pair = []
-                for emptyCellInCol in emptyCellsInCol:
-                    if pairNum in emptyCellInCol.candidates:
-                        pair.append(emptyCellInCol)
-                if pairNum not in xWingNums:
-                    xWingNums[pairNum] = []
-                xWingNums[pairNum].append(pair)
-        for xWingNum in dict(xWingNums):
-            if len(xWingNums[xWingNum]) < 2:
-                del xWingNums[xWingNum]
-            else:
-                for pair1 in xWingNums[xWingNum]:
-                    pair1i = xWingNums[xWingNum].index(pair1)
-                    col1 = self.cells.index(pair1[0]) % 9
-                    irow1 = self.cells.index(pair1[0]) // 9
-                    jrow1 = self.cells.index(pair1[1]) // 9
-                    for pair2 in xWingNums[xWingNum][pair1i + 1:]:
-                        col2 = self.cells.index(pair2[0]) % 9
-                        irow2 = self.cells.index(pair2[0]) // 9
-                        jrow2 = self.cells.index(pair2[1]) // 9
-                        if irow1 == irow2 and jrow1 == jrow2:
-                            removed = False
-                            emptyCellsInIRow = [x for x in self.rowCells(irow1) if x.value == 0 and x not in pair1 and x not in pair2]
-                            emptyCellsInJRow = [x for x in self.rowCells(jrow1) if x.value == 0 and x not in pair1 and x not in pair2]
-                            emptyCellsInIJRows = emptyCellsInIRow + emptyCellsInJRow
-                            for emptyCellInIJRows in emptyCellsInIJRows:
-                                if xWingNum in emptyCellInIJRows.candidates:
-                                    emptyCellInIJRows.candidates.remove(xWingNum)
+        for line in range(g.size):
+            lineCells = lines[line]
+            once = twice = more = 0
+            for i in lineCells:
+                if values[i] == 0:
+                    more |= twice & masks[i]
+                    twice |= once & masks[i]
+                    once |= masks[i]
+            for pairNum in g.maskDigits[twice & ~more]:
+                bit = g.digitBit[pairNum]
+                positions = tuple(p for p in range(g.size) if values[lineCells[p]] == 0 and masks[lineCells[p]] & bit)
+                xWingNums.setdefault(pairNum, []).append((line, positions))
+        for xWingNum, pairs in xWingNums.items():
+            bit = g.digitBit[xWingNum]
+            for pair1i, (line1, positions1) in enumerate(pairs):
+                for line2, positions2 in pairs[pair1i + 1:]:
+                    if positions1 == positions2:
+                        removed = False
+                        for position in positions1:
+                            for p, i in enumerate(crossLines[position]):
+                                if p != line1 and p != line2 and values[i] == 0 and self.eliminate(i, bit):
                                     removed = True
-                            if removed:
-                                receipt += "Columns " + str(col1 + 1) + " and " + str(col2 + 1) + " [" + str(xWingNum) + "]\n"
-        if printReceipt and receipt:
-            print(receipt, end="")
+                        if removed:
+                            if printReceipt:
+                                print(linesName + " " + str(line1 + 1) + " and " + str(line2 + 1) +
+                                      " " + self.digitString([xWingNum]))
+                            if self.log is not None:
+                                self.log.record("X-Wing", (linesName, (line1 + 1, line2 + 1)), (xWingNum,))
+
+    def findBoxLineReductions(self, printReceipt=True):
+        # Where a box meets a line, a digit confined to the intersection within one of the two units cannot appear
+        # in the rest of the other. Each unit is split into its n intersections and the candidates of each are ORed,
+        # so the digits confined to one intersection are those missing from the OR of all the others.
+        g = self.geometry
+        values = self.values
+        masks = self.masks
+        versions = self.unitVersions
+        seen = self.unitsSeen("findBoxLineReductions")
+        for groupName, groups, offset in g.groups:
+            for group in range(g.size):
+                unit = offset + group
+                if seen[unit] == versions[unit]:
+                    continue
+                seen[unit] = versions[unit]
+                placed = 0
+                for i in groups[group]:
+                    placed |= g.digitBit[values[i]]
+                digits = []
+                for segments in g.segments[unit]:
+                    segmentMasks = []
+                    for segment, rest in segments:
+                        mask = 0
+                        for i in segment:
+                            if values[i] == 0:
+                                mask |= masks[i]
+                        segmentMasks.append(mask)
+                    for k, (segment, rest) in enumerate(segments):
+                        others = 0
+                        for other, mask in enumerate(segmentMasks):
+                            if other != k:
+                                others |= mask
+                        confined = segmentMasks[k] & ~others & ~placed
+                        if not confined:
+                            continue
+                        removed = 0
+                        for i in rest:
+                            if values[i] == 0 and masks[i] & confined:
+                                removed |= masks[i] & confined
+                                self.eliminate(i, confined)
+                        if removed:
+                            digits.extend(g.maskDigits[removed])
+                            if self.log is not None:
+                                self.log.record("Box-Line Reduction", (groupName, group + 1), g.maskDigits[removed])
+                if digits and printReceipt:
+                    print(groupName + " " + str(group + 1) + " " + self.digitString(digits))
+
+    def findNakedQuads(self, printReceipt=True):
+        self.findNakedSubsets(4, "Naked Quad", printReceipt)
+
+    def findNakedSubsets(self, size, name, printReceipt=True):
+        # size cells of a unit whose candidates together number size digits take those digits from the unit's
+        # other cells. Cells with more than size candidates can never be part of one, so they are not combined.
+        g = self.geometry
+        values = self.values
+        masks = self.masks
+        versions = self.unitVersions
+        seen = self.unitsSeen("findNakedSubsets" + str(size))
+        for groupName, groups, offset in g.groups:
+            for group in range(g.size):
+                unit = offset + group
+                if seen[unit] == versions[unit]:
+                    continue
+                seen[unit] = versions[unit]
+                emptyCells = [i for i in groups[group] if values[i] == 0]
+                if len(emptyCells) <= size:
+                    continue
+                subsets = []
+                small = [i for i in emptyCells if g.popcount[masks[i]] <= size]
+                for cells in itertools.combinations(small, size):
+                    union = 0
+                    for i in cells:
+                        union |= masks[i]
+                    if g.popcount[union] != size:
+                        continue
+                    removed = False
+                    for i in emptyCells:
+                        if i not in cells and self.eliminate(i, union):
+                            removed = True
+                    if removed:
+                        subsets.append(list(g.maskDigits[union]))
+                        if self.log is not None:
+                            self.log.record(name, (groupName, group + 1), g.maskDigits[union])
+                if subsets and printReceipt:
+                    print(groupName + " " + str(group + 1) + " " + self.digitString(subsets))
+
+    def findHiddenTriples(self, printReceipt=True):
+        self.findHiddenSubsets(3, "Hidden Triple", printReceipt)
+
+    def findHiddenQuads(self, printReceipt=True):
+        self.findHiddenSubsets(4, "Hidden Quad", printReceipt)
+
+    def findHiddenSubsets(self, size, name, printReceipt=True):
+        # size digits of a unit whose places together number size cells own those cells, so every other candidate
+        # leaves them. The places of each digit are kept as a bitmask over the unit's cells.
+        g = self.geometry
+        values = self.values
+        masks = self.masks
+        versions = self.unitVersions
+        seen = self.unitsSeen("findHiddenSubsets" + str(size))
+        for groupName, groups, offset in g.groups:
+            for group in range(g.size):
+                unit = offset + group
+                if seen[unit] == versions[unit]:
+                    continue
+                seen[unit] = versions[unit]
+                unitCells = groups[group]
+                placed = 0
+                places = [0] * (g.size + 1)
+                for p, i in enumerate(unitCells):
+                    if values[i]:
+                        placed |= g.digitBit[values[i]]
+                    else:
+                        for d in g.maskDigits[masks[i]]:
+                            places[d] |= 1 << p
+                digits = [d for d in range(1, g.size + 1)
+                          if not placed & g.digitBit[d] and 2 <= g.popcount[places[d]] <= size]
+                subsets = []
+                for subset in itertools.combinations(digits, size):
+                    union = 0
+                    digitMask = 0
+                    for d in subset:
+                        union |= places[d]
+                        digitMask |= g.digitBit[d]
+                    if g.popcount[union] != size:
+                        continue
+                    removed = False
+                    for p, i in enumerate(unitCells):
+                        if union >> p & 1 and self.eliminate(i, masks[i] & ~digitMask):
+                            removed = True
+                    if removed:
+                        subsets.append(list(subset))
+                        if self.log is not None:
+                            self.log.record(name, (groupName, group + 1), subset)
+                if subsets and printReceipt:
+                    print(groupName + " " + str(group + 1) + " " + self.digitString(subsets))
+
+    def findSwordfish(self, printReceipt=True):
+        self.findFish(3, "Swordfish", printReceipt)
+
+    def findJellyfish(self, printReceipt=True):
+        self.findFish(4, "Jellyfish", printReceipt)
+
+    def findFish(self, size, name, printReceipt=True):
+        g = self.geometry
+        self.findFishInLines("Rows", g.rowIndices, g.colIndices, 0, size, name, printReceipt)
+        self.findFishInLines("Columns", g.colIndices, g.rowIndices, g.size, size, name, printReceipt)
 
-    def bruteForce(self, filledCells, cell, emptyCells, printReceipt=True):
+    def findFishInLines(self, linesName, lines, crossLines, offset, size, name, printReceipt=True):
+        # The X-Wing generalized to size lines: if a digit's places in size lines all fall within size cross lines,
+        # it can be removed from the rest of those cross lines. Places are kept as bitmasks over line positions.
+        g = self.geometry
+        values = self.values
+        masks = self.masks
+        versions = self.unitVersions
+        seen = self.unitsSeen("findFish" + str(size))
+        if all(seen[unit] == versions[unit] for unit in range(offset, offset + g.size)):
+            return
+        for unit in range(offset, offset + g.size):
+            seen[unit] = versions[unit]
+        places = [[0] * g.size for _ in range(g.size + 1)]
+        for line in range(g.size):
+            for p, i in enumerate(lines[line]):
+                if values[i] == 0:
+                    for d in g.maskDigits[masks[i]]:
+                        places[d][line] |= 1 << p
+        for digit in range(1, g.size + 1):
+            bit = g.digitBit[digit]
+            fishLines = [line for line in range(g.size) if 2 <= g.popcount[places[digit][line]] <= size]
+            for fish in itertools.combinations(fishLines, size):
+                union = 0
+                for line in fish:
+                    union |= places[digit][line]
+                if g.popcount[union] != size:
+                    continue
+                removed = False
+                for position in range(g.size):
+                    if union >> position & 1:
+                        for p, i in enumerate(crossLines[position]):
+                            if p not in fish and values[i] == 0 and self.eliminate(i, bit):
+                                removed = True
+                if removed:
+                    if printReceipt:
+                        print(linesName + " " + ", ".join(str(line + 1) for line in fish[:-1]) + " and " +
+                              str(fish[-1] + 1) + " " + self.digitString([digit]))
+                    if self.log is not None:
+                        self.log.record(name, (linesName, tuple(line + 1 for line in fish)), (digit,))
+
+    def findXYWings(self, printReceipt=True):
+        # A pivot with candidates xy sees one pincer with xz and another with yz: whichever of x and y the pivot
+        # takes, one pincer is z, so z leaves every cell that sees both pincers. Only two-candidate cells take part.
+        g = self.geometry
+        values = self.values
+        masks = self.masks
+        versions = self.unitVersions
+        seen = self.unitsSeen("findXYWings")
+        if all(seen[unit] == versions[unit] for unit in range(len(versions))):
+            return
+        for unit in range(len(versions)):
+            seen[unit] = versions[unit]
+        for pivot in range(g.cells):
+            pivotMask = masks[pivot]
+            if values[pivot] or g.popcount[pivotMask] != 2:
+                continue
+            pincers = [p for p in g.peers[pivot]
+                       if values[p] == 0 and g.popcount[masks[p]] == 2 and g.popcount[masks[p] & pivotMask] == 1]
+            for ai, a in enumerate(pincers):
+                for b in pincers[ai + 1:]:
+                    shared = masks[a] & pivotMask
+                    z = masks[a] & ~pivotMask
+                    if masks[b] & pivotMask == shared or masks[b] & ~pivotMask != z:
+                        continue
+                    removed = False
+                    for i in g.peerSets[a] & g.peerSets[b]:
+                        if i != pivot and values[i] == 0 and self.eliminate(i, z):
+                            removed = True
+                    if removed:
+                        digit = g.lowestDigit[z]
+                        if printReceipt:
+                            print("Row " + str(g.rowOf[pivot] + 1) + " Column " + str(g.colOf[pivot] + 1) + " " +
+                                  self.digitString(g.maskDigits[pivotMask]) + " " + self.digitString([digit]))
+                        if self.log is not None:
+                            self.log.record("XY-Wing", ("Cell", (g.rowOf[pivot] + 1, g.colOf[pivot] + 1)), (digit,))
+
+    def bruteForce(self, filledCells, cell, emptyCells, printReceipt=True, deadline=None):
+        size = self.geometry.size
+        if deadline is not None and time.perf_counter() > deadline:
+            cell.value = 0
+            self.timedOut = True
+            return False
+        if self.metrics is not None:
+            self.metrics.node(len(filledCells) + 1)
         foundTrueValue = False
         while not foundTrueValue:
-            while cell.value not in cell.candidates and cell.value < 9:
+            while cell.value not in cell.candidates and cell.value < size:
                 cell.value += 1
             if not self.cellCausesError(cell, filledCells):
                 if not emptyCells:
@@ -467,14 +1612,18 @@ class Table:
                     filledTmp.append(cell)
                     cellTmp = emptyTmp.pop(0)
                     cellTmp.value = 1
-                    foundTrueValue = self.bruteForce(filledTmp, cellTmp, emptyTmp, printReceipt)
+                    foundTrueValue = self.bruteForce(filledTmp, cellTmp, emptyTmp, printReceipt, deadline)
                     if not foundTrueValue:
-                        if cell.value == 9:
+                        if self.timedOut:
+                            cell.value = 0
+                            return False
+                        if cell.value == size:
+                            cell.value = 0
                             if printReceipt:
-                                cell.value = "_"
-                                print(self)
+                                print(self.boardString(cell.index))
                                 print("Stuck")
-                            cell.value = 0
+                            if self.metrics is not None:
+                                self.metrics.backtracks += 1
                             return False
                         else:
                             cell.value += 1
@@ -482,17 +1631,93 @@ class Table:
                         cell.candidates = [cell.value]
                         return True
             else:
-                if cell.value == 9:
+                if cell.value == size:
+                    cell.value = 0
                     if printReceipt:
-                        cell.value = "_"
-                        print(self)
+                        print(self.boardString(cell.index))
                         print("Stuck")
-                    cell.value = 0
+                    if self.metrics is not None:
+                        self.metrics.backtracks += 1
                     return False
                 else:
                     cell.value += 1
 
-    def bruteForceSolve(self, printReceipt=True):
+    def bruteForceSolve(self, printReceipt=True, engine="dlx", timeout=None, workers=None):
+        # With workers, the search is split across that many processes (see parallelSearch), each running engine.
+        if engine == "legacy" and workers is None:
+            return self.legacyBruteForceSolve(printReceipt, timeout)
+        if engine not in SEARCH_ENGINES:
+            raise ValueError("Unknown search engine " + repr(engine))
+        deadline = time.perf_counter() + timeout if timeout is not None else None
+        if workers is not None:
+            solutions, timedOut = parallelSearch(self.values, self.masks, 1, deadline, self.geometry, self.metrics,
+                                                 workers, engine)
+        else:
+            solutions, timedOut = SEARCH_ENGINES[engine](self.values, self.masks, 1, deadline, self.geometry,
+                                                         self.metrics)
+        if solutions:
+            self.fillSolution(solutions[0])
+        self.timedOut = timedOut
+        if printReceipt:
+            print(self)
+            print("Solved" if solutions else "Timed Out" if timedOut else "Stuck")
+        return bool(solutions)
+
+    def fillSolution(self, solution):
+        for i, value in enumerate(solution):
+            if self.log is not None and self.values[i] == 0:
+                self.log.placed(i, value)
+            if self.values[i] != value:
+                self.values[i] = value
+                self.masks[i] = self.geometry.digitBit[value]
+                self.changed(i)
+        if self.log is not None:
+            self.log.record("Brute Force", None, ())
+
+    def hybridSolve(self, printReceipt=True, order=1, timeout=None):
+        # Deductive techniques until they stall, then a search from the candidates they leave, placing singles and
+        # applying pointing pairs and box-line reductions at every node. Returns "solved", "unsolvable" or "timeout";
+        # the board is filled only when solved. The search runs even on a full board, to check it. The timeout covers
+        # both phases.
+        deadline = time.perf_counter() + timeout if timeout is not None else None
+        self.deductiveSolve(printReceipt, order, search=False, timeout=timeout)
+        if printReceipt and 0 in self.values and not self.timedOut:
+            print("Searching")
+        if self.timedOut or deadline is not None and time.perf_counter() > deadline:
+            solutions, timedOut = [], True
+        else:
+            solutions, timedOut = backtrackSearch(self.values, self.masks, 1, deadline, self.geometry, self.metrics,
+                                                  intersections=True)
+        if solutions:
+            self.fillSolution(solutions[0])
+        status = "solved" if solutions else "timeout" if timedOut else "unsolvable"
+        if printReceipt:
+            print(self)
+            print({"solved": "Solved", "timeout": "Timed Out", "unsolvable": "Unsolvable"}[status])
+        return status
+
+    def countSolutions(self, limit=2, timeout=None, workers=None):
+        # Number of solutions, counting no further than limit, so the default answers whether the puzzle is unique.
+        # Returns None if the time budget ran out first. The board itself is left as it is. With workers, the count
+        # is split across that many processes.
+        table = self.copy()
+        if not table.propagating:
+            table.startPropagating()
+        table.propagate(False)
+        deadline = time.perf_counter() + timeout if timeout is not None else None
+        if workers is not None:
+            solutions, timedOut = parallelSearch(table.values, table.masks, limit, deadline, self.geometry,
+                                                 self.metrics, workers)
+        else:
+            solutions, timedOut = exactCoverSearch(table.values, table.masks, limit, deadline, self.geometry,
+                                                   self.metrics)
+        if timedOut:
+            return None
+        return len(solutions)
+
+    def legacyBruteForceSolve(self, printReceipt=True, timeout=None):
+        # The original recursive search, kept for comparison. Returns whether it solved the board, as
+        # bruteForceSolve does; a full board counts as solved when no two peers share a value.
         emptyCells = []
         filledCells = []
         for cell in self.cells:
@@ -501,11 +1726,38 @@ class Table:
                 emptyCells.append(cell)
             else:
                 filledCells.append(cell)
+        self.timedOut = False
+        if not emptyCells:
+            solved = not any(self.cellCausesError(cell) for cell in filledCells)
+            if printReceipt:
+                print(self)
+                print("Solved" if solved else "Stuck")
+            return solved
+        deadline = time.perf_counter() + timeout if timeout is not None else None
         cell = emptyCells.pop(0)
         cell.value = 1
-        self.bruteForce(filledCells, cell, emptyCells, printReceipt)
+        metrics = self.metrics
+        if metrics is not None:
+            # bruteForce counts into a fresh SolveMetrics whose depths include the givens, taken off here.
+            self.metrics = SolveMetrics()
+        try:
+            solved = self.bruteForce(filledCells, cell, emptyCells, printReceipt, deadline)
+        finally:
+            if metrics is not None:
+                search, self.metrics = self.metrics, metrics
+                metrics.searched(search.nodes, search.backtracks, search.maxDepth - len(filledCells))
+        if printReceipt and self.timedOut:
+            print(self)
+            print("Timed Out")
+        return solved
 
-    def deductiveSolve(self, printReceipt=True, order=1):
+    def deductiveSolve(self, printReceipt=True, order=1, propagate=True, search=True, timeout=None):
+        # order is one of the fixed orders below, a list of technique numbers, "adaptive" for a fresh
+        # TechniqueScheduler or a scheduler to reuse, or "auto" (or an OrderProfile) to pick the order that was
+        # fastest for puzzles like this one. When every technique stalls the board is brute forced, or with search
+        # False, left as it is ("Stalled"). With a timeout, the deadline is checked before each technique and bounds
+        # the brute force; running out leaves the board as it is and self.timedOut set ("Timed Out"). Returns the
+        # number of steps taken.
         functions = {
             1: [self.findNakedSingles, "Finding Naked Singles"],
             2: [self.findHiddenSingles, "Finding Hidden Singles"],
@@ -513,7 +1765,14 @@ class Table:
             4: [self.findHiddenPairs, "Finding Hidden Pairs"],
             5: [self.findPointingPairs, "Finding Pointing Pairs"],
             6: [self.findNakedTriples, "Finding Naked Triples"],
-            7: [self.findXWings, "Finding X-Wings"]
+            7: [self.findXWings, "Finding X-Wings"],
+            8: [self.findBoxLineReductions, "Finding Box-Line Reductions"],
+            9: [self.findHiddenTriples, "Finding Hidden Triples"],
+            10: [self.findNakedQuads, "Finding Naked Quads"],
+            11: [self.findHiddenQuads, "Finding Hidden Quads"],
+            12: [self.findSwordfish, "Finding Swordfish"],
+            13: [self.findXYWings, "Finding XY-Wings"],
+            14: [self.findJellyfish, "Finding Jellyfish"]
         }
         orders = {
             1: [1, 2, 3, 4, 5, 6, 7],
@@ -535,70 +1794,304 @@ class Table:
             17: [1, 2, 3, 6, 7, 4, 5],
             18: [1, 2, 3, 6, 7, 5, 4]
         }
+        # The techniques beyond the first seven follow them in every order, roughly from cheapest to costliest.
+        for techniques in orders.values():
+            techniques.extend(range(8, 15))
+        if order == "auto":
+            order = defaultProfile()
+        if isinstance(order, OrderProfile):
+            order = order.orderFor(self)
+        scheduler = None
+        if order == "adaptive":
+            scheduler = TechniqueScheduler(orders[1])
+        elif isinstance(order, TechniqueScheduler):
+            scheduler = order
+        elif isinstance(order, (list, tuple)):
+            order = tuple(order)
+            orders[order] = list(order)
+        idleAt = {}
+        deadline = time.perf_counter() + timeout if timeout is not None else None
+        self.timedOut = False
         solved = False
         stuck = False
         stepNum = 0
         if printReceipt:
             print(self)
+        if propagate and not self.propagating:
+            self.measure(self.startPropagating)
+            if printReceipt:
+                print("Propagating Givens")
+            self.measure(self.propagate, printReceipt)
         while not solved and not stuck:
             stepNum += 1
             if printReceipt:
                 print("Step " + str(stepNum) + ":")
                 print("Remaining Candidates")
-            for cell in self.cellsLeft():
-                self.removeImpossibleCandidates(cell, printReceipt)
-            numCellsLeftBefore = len(self.cellsLeft())
-            numCandidatesLeftBefore = self.numCandidatesLeft()
-            for function in orders[order]:
+            if not propagate:
+                for cell in self.cellsLeft():
+                    self.removeImpossibleCandidates(cell, printReceipt)
+            elif printReceipt:
+                for cell in self.cellsLeft():
+                    print("Row " + str(cell.row + 1) + " Column " + str(cell.col + 1) + " " +
+                          self.digitString(cell.candidates))
+            numCellsLeftBefore = self.values.count(0)
+            numCandidatesLeftBefore = self.numCandidatesLeft() if printReceipt else 0
+            changesBefore = self.changes
+            for function in (orders[order] if scheduler is None else scheduler.order()):
+                if deadline is not None and time.perf_counter() > deadline:
+                    self.timedOut = True
+                    break
+                if scheduler is not None:
+                    # A technique that found nothing cannot find anything until the board changes.
+                    if idleAt.get(function) == self.changes:
+                        continue
+                    changes = self.changes
+                    start = time.perf_counter_ns()
                 if printReceipt:
                     print(functions[function][1])
-                functions[function][0](printReceipt)
-                if self.numCandidatesLeft() != numCandidatesLeftBefore:
+                self.measure(functions[function][0], printReceipt)
+                if propagate:
+                    self.measure(self.propagate, printReceipt)
+                if scheduler is not None:
+                    scheduler.update(function, time.perf_counter_ns() - start, self.changes - changes)
+                    if self.changes == changes:
+                        idleAt[function] = self.changes
+                if self.changes != changesBefore:
                     break
-            if self.numCandidatesLeft() == numCandidatesLeftBefore:
+            if self.changes == changesBefore and search and not self.timedOut:
                 if printReceipt:
                     print("Solving with Brute Force")
-                self.bruteForceSolve(False)
-            numCellsLeftAfter = len(self.cellsLeft())
-            numCandidatesLeftAfter = self.numCandidatesLeft()
+                self.measure(self.bruteForceSolve, False, "dlx",
+                             None if deadline is None else max(0.0, deadline - time.perf_counter()))
+            numCellsLeftAfter = self.values.count(0)
             if printReceipt:
+                numCandidatesLeftAfter = self.numCandidatesLeft()
                 print(self)
                 print("Cells Filled", numCellsLeftBefore - numCellsLeftAfter)
                 print("Candidates Removed", numCandidatesLeftBefore - numCandidatesLeftAfter)
-            if not self.cellsLeft():
+            if not numCellsLeftAfter:
                 solved = True
-                print("Solved")
-            elif numCandidatesLeftAfter == numCandidatesLeftBefore:
+                if printReceipt:
+                    print("Solved")
+            elif self.changes == changesBefore:
                 stuck = True
-                print("Stuck")
+                if printReceipt:
+                    print("Timed Out" if self.timedOut else "Stuck" if search else "Stalled")
+        return stepNum
+
+
+def timeBudget(timeout, until):
+    # Seconds a puzzle may take: its own timeout, cut short by `until`, the wall-clock time (time.time()) by which
+    # its whole batch must be done. Wall-clock time is what worker processes can share.
+    if until is None:
+        return timeout
+    remaining = max(0.0, until - time.time())
+    return remaining if timeout is None else min(timeout, remaining)
+
+
+def solvePuzzle(puzzle, timeout=None, until=None):
+    timeout = timeBudget(timeout, until)
+    if timeout == 0:
+        return None
+    table = Table.fromString(puzzle)
+    table.startPropagating()
+    table.propagate(False)
+    if table.bruteForceSolve(False, timeout=timeout):
+        return table.toString()
+    return None
+
+
+workerCaches = {}
+
+
+def workerCache(cacheSize, cachePath=None):
+    # Each process keeps its own SolutionCache; a cachePath lets them share results through SQLite.
+    cache = workerCaches.get((cacheSize, cachePath))
+    if cache is None:
+        import SudokuCache
+        cache = workerCaches[(cacheSize, cachePath)] = SudokuCache.SolutionCache(cacheSize, cachePath)
+    return cache
+
+
+def solveChunk(puzzles, timeout=None, backend="scalar", cacheSize=0, cachePath=None, until=None):
+    # With until, puzzles still unsolved at that wall-clock time are given up on, however many are left.
+    if cacheSize:
+        cache = workerCache(cacheSize, cachePath)
+        solutions = [cache.solve(puzzle, lambda form: solvePuzzle(form, timeout, until)) for puzzle in puzzles]
+        cache.commit()
+        return solutions
+    if backend == "numpy" and all(len(puzzle) == 81 for puzzle in puzzles):
+        import SudokuVectorized
+        return SudokuVectorized.solveBatch(puzzles, timeout, until)
+    return [solvePuzzle(puzzle, timeout, until) for puzzle in puzzles]
+
+
+def solveMany(puzzles, workers=None, chunksize=64, timeout=None, backend="scalar", cacheSize=0, cachePath=None):
+    # Yields the solution string of each puzzle, or None if it has no solution or ran out of time, in input order.
+    # Puzzles travel to the worker processes as strings, a chunk per task, with at most two chunks per worker in
+    # flight so that arbitrarily long inputs never pile up in memory. backend="numpy" runs the singles sweeps of each
+    # 9x9 chunk as array operations (NumPy required), so it wants much larger chunks. A nonzero cacheSize looks
+    # puzzles up in a per-worker SolutionCache first (this takes the place of the backend).
+    tasks = ((chunk, timeout, backend, cacheSize, cachePath) for chunk in iterChunks(puzzles, chunksize))
+    for solutions in orderedMap(solveChunk, tasks, workers):
+        yield from solutions
+
+
+def iterChunks(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def orderedMap(function, tasks, workers=None):
+    # Yields function(*task) for each task, in order, computed on a pool of worker processes (all cores by default)
+    # with at most two tasks per worker in flight, so that arbitrarily long inputs never pile up in memory. A single
+    # worker runs the tasks in this process.
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1:
+        for task in tasks:
+            yield function(*task)
+        return
+    from concurrent.futures import ProcessPoolExecutor
+    from collections import deque
+    with ProcessPoolExecutor(workers) as executor:
+        pending = deque()
+        for task in tasks:
+            pending.append(executor.submit(function, *task))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def batchRun(path, workers=None, timeout=None, outPath="-", outFormat="line", backend="scalar", chunksize=None,
+             cacheSize=0, cachePath=None):
+    # Streams puzzles from a grid, one-line or gzip file ("-" for stdin) through solveMany, writing one solution per
+    # puzzle and "unsolved" for failures.
+    import SudokuIO
+    if chunksize is None:
+        chunksize = 2048 if backend == "numpy" else 64
+    solutions = solveMany(SudokuIO.readPuzzles(path), workers, chunksize, timeout, backend, cacheSize, cachePath)
+    return SudokuIO.writePuzzles(solutions, outPath, outFormat)
 
 
 def testRuns():
     numRuns = 1
+    import SudokuIO
     for run in range(numRuns):
         print("Run", run + 1)
-        file = open("SudokuTable.txt", "r")
-        line = ""
         tableNum = 0
         totalTime = 0
-        while not line:
+        # Only the tables above the first dashed line are run.
+        for puzzle in SudokuIO.readPuzzles("SudokuTable.txt", until="---"):
             tableNum += 1
             print("Table", tableNum)
-            cells = []
-            for n in range(9):
-                line = file.readline()
-                for data in line.split():
-                    cells.append(Cell(data))
-            sudokuTable = Table(copy.deepcopy(cells))
+            sudokuTable = Table.fromString(puzzle)
             start = time.time()
-            sudokuTable.deductiveSolve()
+            sudokuTable.deductiveSolve(order="auto")
             end = time.time()
             duration = end - start
             totalTime += duration
             print(duration, "seconds")
-            line = file.readline()[:-1]
         print("Total Time", totalTime, "seconds")
 
 
+def solveOne(puzzle, engine="deductive", search="dlx", timeout=None, printReceipt=False):
+    # Solves a puzzle string the way the command line asks; returns the table and its status, one of those of
+    # hybridSolve, or "unsolved" when another engine did not finish for any reason but the timeout.
+    table = Table.fromString(puzzle)
+    if engine == "hybrid":
+        return table, table.hybridSolve(printReceipt, "auto", timeout)
+    if engine == "deductive":
+        table.deductiveSolve(printReceipt, order="auto", timeout=timeout)
+    else:
+        table.startPropagating()
+        table.propagate(False)
+        # Propagation alone may fill the board, leaving nothing to search but the check that it is consistent.
+        if 0 in table.values:
+            table.bruteForceSolve(printReceipt, search, timeout)
+    if 0 not in table.values and not any(table.cellCausesError(cell) for cell in table.cells):
+        return table, "solved"
+    return table, "timeout" if table.timedOut else "unsolved"
+
+
+def main(argv=None):
+    # Solves the puzzles given on the command line or on stdin and writes their solutions to stdout, or runs a
+    # --batch, --test-runs or the like. Returns the exit status: 1 if a puzzle was left unsolved.
+    import argparse
+    parser = argparse.ArgumentParser(description="Sudoku Solver")
+    parser.add_argument("puzzle", nargs="?", default="-",
+                        help="puzzle to solve (one line, or a grid in one argument), or - to read puzzles from stdin")
+    parser.add_argument("--input-format", choices=["auto", "line", "grid"], default="auto",
+                        help="kind of puzzle to read; auto takes both")
+    parser.add_argument("--engine", choices=["deductive", "brute", "hybrid"], default="deductive",
+                        help="deductive techniques (searching only when they stall), search alone, or deductive "
+                             "techniques and then one search from where they stall")
+    parser.add_argument("--search", choices=sorted(SEARCH_ENGINES) + ["legacy"], default="dlx",
+                        help="search engine for --engine brute")
+    parser.add_argument("-q", "--quiet", action="store_true", help="write only the solutions, without receipts")
+    parser.add_argument("--test-runs", action="store_true", help="run the tables of SudokuTable.txt with receipts")
+    parser.add_argument("--batch", metavar="FILE", help="solve a file of puzzles (grid, one-line or gzip), or - for stdin")
+    parser.add_argument("--output", metavar="FILE", default="-", help="where --batch writes solutions (.gz to compress)")
+    parser.add_argument("--output-format", choices=["line", "grid", "json"], default="line",
+                        help="solution format; json writes a record per puzzle and is not available for --batch")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes for --batch (default: all cores)")
+    parser.add_argument("--timeout", type=float, default=None, help="seconds allowed per puzzle")
+    parser.add_argument("--backend", choices=["scalar", "numpy"], default="scalar", help="how --batch solves a chunk")
+    parser.add_argument("--chunksize", type=int, default=None, help="puzzles per task for --batch")
+    parser.add_argument("--cache-size", type=int, default=0, help="solutions each --batch worker keeps in memory")
+    parser.add_argument("--cache-path", default=None, help="SQLite file that persists the --batch solution cache")
+    args = parser.parse_args(argv)
+    if args.test_runs:
+        testRuns()
+        return 0
+    if args.batch:
+        if args.output_format == "json":
+            parser.error("--output-format json is not available for --batch")
+        batchRun(args.batch, args.workers, args.timeout, args.output, args.output_format, args.backend, args.chunksize,
+                 args.cache_size, args.cache_path)
+        return 0
+    import SudokuIO
+    if args.puzzle == "-":
+        # Strict, so that a line that is not a puzzle still gets its line of output.
+        puzzles = SudokuIO.iterPuzzles(sys.stdin, format=args.input_format, strict=True)
+    else:
+        puzzles = list(SudokuIO.iterPuzzles(args.puzzle.splitlines(), format=args.input_format, strict=True))
+        if not puzzles or None in puzzles:
+            parser.error("not a puzzle: " + repr(args.puzzle))
+    unsolved = 0
+
+    def solutions():
+        nonlocal unsolved
+        for puzzle in puzzles:
+            if puzzle is None:
+                unsolved += 1
+                if args.output_format == "json":
+                    import json
+                    yield json.dumps({"puzzle": None, "status": "invalid", "solution": None})
+                else:
+                    yield None
+                continue
+            table, status = solveOne(puzzle, args.engine, args.search, args.timeout, not args.quiet)
+            solved = status == "solved"
+            unsolved += not solved
+            if args.output_format == "json":
+                import json
+                yield json.dumps({"puzzle": puzzle, "status": status,
+                                  "solution": table.toString() if solved else None})
+            else:
+                yield table.toString() if solved else None
+
+    # Receipts and solutions share stdout, so each solution follows its receipt.
+    SudokuIO.writePuzzles(solutions(), "-", "line" if args.output_format == "json" else args.output_format)
+    return 1 if unsolved else 0
+
+
 if __name__ == "__main__":
-    testRuns()
+    sys.exit(main())
@@ -0,0 +1,266 @@
+# Joe Shymanski
+# Sudoku Solver - binary puzzle store
+# A store is a 16-byte header followed by fixed-size records, read through mmap so that a record is just an offset.
+# The header holds a magic string, the format version, the box size, the encoding and the record count. Records hold
+# one byte per cell (0 for blanks), or two cells per byte when the box size is 3 (the high nibble first), so a 9x9
+# puzzle takes 41 bytes. A results file has the same layout and as many records as the store it was solved from.
+# Each of its records starts with a status byte and the solve time in microseconds (a 4-byte integer), followed by
+# the solution in the store's encoding. Record i of the results belongs to puzzle i of the store.
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+from SudokuSolver import Table, exactCoverSearch, geometryFor, boxSizeFor, orderedMap
+
+HEADER = struct.Struct("<4sBBBxQ")
+PUZZLES_MAGIC = b"SDKP"
+RESULTS_MAGIC = b"SDKR"
+VERSION = 1
+BYTES, NIBBLES = 0, 1
+STATS = struct.Struct("<BI")
+# Result statuses; a zeroed record is one that has not been solved yet.
+PENDING, SOLVED, UNSOLVABLE, TIMED_OUT = 0, 1, 2, 3
+STATUS_NAMES = ["pending", "solved", "unsolvable", "timeout"]
+HIGH_NIBBLES = bytes(b >> 4 for b in range(256))
+LOW_NIBBLES = bytes(b & 15 for b in range(256))
+
+
+def payloadSize(cells, encoding):
+    return (cells + 1) // 2 if encoding == NIBBLES else cells
+
+
+def encodeValues(values, encoding):
+    if encoding == BYTES:
+        return bytes(values)
+    if len(values) % 2:
+        values = list(values) + [0]
+    return bytes(values[k] << 4 | values[k + 1] for k in range(0, len(values), 2))
+
+
+def decodeValues(payload, cells, encoding):
+    # payload is any bytes-like object, such as a memoryview into the map; only the returned list is new.
+    if encoding == BYTES:
+        return list(payload)
+    values = [0] * (2 * len(payload))
+    values[0::2] = bytes(payload).translate(HIGH_NIBBLES)
+    values[1::2] = bytes(payload).translate(LOW_NIBBLES)
+    del values[cells:]
+    return values
+
+
+class PuzzleStore:
+    # A store or results file opened through mmap. record(i) and records(start, stop) are memoryviews into the map,
+    # so slicing a range of puzzles copies nothing.
+    def __init__(self, path, write=False):
+        self.path = path
+        self.file = open(path, "r+b" if write else "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_WRITE if write else mmap.ACCESS_READ)
+        magic, version, self.n, self.encoding, self.count = HEADER.unpack_from(self.map)
+        if magic not in (PUZZLES_MAGIC, RESULTS_MAGIC) or version != VERSION:
+            self.close()
+            raise ValueError(path + " is not a puzzle store")
+        self.results = magic == RESULTS_MAGIC
+        self.cells = self.n ** 4
+        self.prefix = STATS.size if self.results else 0
+        self.recordSize = self.prefix + payloadSize(self.cells, self.encoding)
+        self.view = memoryview(self.map)
+
+    def __len__(self):
+        return self.count
+
+    def record(self, index):
+        offset = HEADER.size + index * self.recordSize
+        return self.view[offset:offset + self.recordSize]
+
+    def records(self, start, stop):
+        return self.view[HEADER.size + start * self.recordSize:HEADER.size + stop * self.recordSize]
+
+    def values(self, index):
+        return decodeValues(self.record(index)[self.prefix:], self.cells, self.encoding)
+
+    def stats(self, index):
+        # (status, microseconds) of a results record.
+        return STATS.unpack_from(self.record(index))
+
+    def puzzle(self, index):
+        symbols = "." + geometryFor(self.n).symbols
+        return "".join(symbols[value] for value in self.values(index))
+
+    def flush(self):
+        self.map.flush()
+
+    def close(self):
+        if getattr(self, "view", None) is not None:
+            self.view.release()
+            self.view = None
+        self.map.close()
+        self.file.close()
+
+
+def writeStore(path, puzzles, n=3, packed=True):
+    # Writes puzzle strings of box size n to a new store; returns the count. Packing only applies to box size 3.
+    geometry = geometryFor(n)
+    encoding = NIBBLES if packed and n == 3 else BYTES
+    count = 0
+    with open(path, "wb") as file:
+        file.write(HEADER.pack(PUZZLES_MAGIC, VERSION, n, encoding, 0))
+        for puzzle in puzzles:
+            if len(puzzle) != geometry.cells:
+                raise ValueError("Expected " + str(geometry.cells) + " cells, got " + str(len(puzzle)))
+            file.write(encodeValues(puzzle.encode("ascii").translate(geometry.symbolValues), encoding))
+            count += 1
+        file.seek(0)
+        file.write(HEADER.pack(PUZZLES_MAGIC, VERSION, n, encoding, count))
+    return count
+
+
+def openResults(path, store):
+    # Opens the results file for store, creating it (full size and zeroed, so every record is pending) if needed.
+    if not os.path.exists(path):
+        with open(path, "wb") as file:
+            file.write(HEADER.pack(RESULTS_MAGIC, VERSION, store.n, store.encoding, store.count))
+            file.truncate(HEADER.size + store.count * (STATS.size + payloadSize(store.cells, store.encoding)))
+    results = PuzzleStore(path, write=True)
+    if not results.results or (results.n, results.encoding, results.count) != (store.n, store.encoding, store.count):
+        results.close()
+        raise ValueError(path + " does not hold results for " + store.path)
+    return results
+
+
+openStores = {}
+
+
+def workerStore(path):
+    # Each process maps a store once and keeps it open for the chunks it is sent.
+    store = openStores.get(path)
+    if store is None:
+        store = openStores[path] = PuzzleStore(path)
+    return store
+
+
+def solveSlice(path, start, stop, timeout=None):
+    # Solves puzzles start to stop of the store at path; returns their results records, back to back.
+    store = workerStore(path)
+    geometry = geometryFor(store.n)
+    out = bytearray()
+    for index in range(start, stop):
+        begin = time.perf_counter()
+        table = Table.fromValues(store.values(index), store.n)
+        table.startPropagating()
+        table.propagate(False)
+        deadline = begin + timeout if timeout is not None else None
+        solutions, timedOut = exactCoverSearch(table.values, table.masks, 1, deadline, geometry)
+        micros = min(int((time.perf_counter() - begin) * 1e6), 0xFFFFFFFF)
+        if solutions:
+            out += STATS.pack(SOLVED, micros) + encodeValues(solutions[0], store.encoding)
+        else:
+            out += STATS.pack(TIMED_OUT if timedOut else UNSOLVABLE, micros) + bytes(payloadSize(store.cells, store.encoding))
+    return bytes(out)
+
+
+def solveRange(path, outPath, start=0, stop=None, workers=None, chunksize=1024, timeout=None, checkpointEvery=16):
+    # Solves puzzles start to stop of the store into the results file at outPath. Only indices travel to the
+    # workers, which read the puzzles from their own mapping. Every checkpointEvery chunks the results are flushed
+    # and the end of the finished prefix is recorded in outPath + ".checkpoint", so a run that is interrupted and
+    # started again on the same range carries on from there. Returns the number of puzzles this call went through.
+    store = PuzzleStore(path)
+    results = openResults(outPath, store)
+    checkpointPath = outPath + ".checkpoint"
+    if stop is None or stop > store.count:
+        stop = store.count
+    first = start
+    if os.path.exists(checkpointPath):
+        with open(checkpointPath) as file:
+            saved = json.load(file)
+        if (saved["start"], saved["stop"]) == (start, stop):
+            first = saved["next"]
+    chunks = [(first, min(first + chunksize, stop)) for first in range(first, stop, chunksize)]
+    written = 0
+
+    def finished(first, last, records):
+        nonlocal written
+        results.records(first, last)[:] = records
+        written += 1
+        if written % checkpointEvery == 0 or last == stop:
+            results.flush()
+            with open(checkpointPath + ".tmp", "w") as file:
+                json.dump({"start": start, "stop": stop, "next": last}, file)
+            os.replace(checkpointPath + ".tmp", checkpointPath)
+        return last - first
+
+    count = 0
+    try:
+        # Chunks are written back in order, so the checkpoint always marks a finished prefix.
+        tasks = ((path, first, last, timeout) for first, last in chunks)
+        for (first, last), records in zip(chunks, orderedMap(solveSlice, tasks, workers)):
+            count += finished(first, last, records)
+        return count
+    finally:
+        results.close()
+        store.close()
+
+
+def main(argv=None):
+    import argparse
+    import SudokuIO
+    parser = argparse.ArgumentParser(description="Sudoku Solver binary puzzle store")
+    commands = parser.add_subparsers(dest="command", required=True)
+    pack = commands.add_parser("pack", help="write the puzzles of a text file to a store")
+    pack.add_argument("input", help="grid, one-line or gzip file, or - for stdin")
+    pack.add_argument("store")
+    pack.add_argument("--bytes", action="store_true", help="one byte per cell even for 9x9 boards")
+    solve = commands.add_parser("solve", help="solve a range of a store into a results file")
+    solve.add_argument("store")
+    solve.add_argument("results")
+    solve.add_argument("--start", type=int, default=0, help="first puzzle to solve")
+    solve.add_argument("--stop", type=int, help="puzzle to stop before (default: the end)")
+    solve.add_argument("--workers", type=int, help="worker processes (default: all cores)")
+    solve.add_argument("--chunksize", type=int, default=1024, help="puzzles per task sent to a worker")
+    solve.add_argument("--timeout", type=float, help="seconds allowed per puzzle")
+    solve.add_argument("--checkpoint-every", type=int, default=16, help="chunks between checkpoints")
+    unpack = commands.add_parser("unpack", help="write the puzzles of a store, or the solutions of a results file")
+    unpack.add_argument("store")
+    unpack.add_argument("--output", default="-", help="output file, .gz to compress (default: stdout)")
+    unpack.add_argument("--output-format", choices=["line", "grid"], default="line")
+    unpack.add_argument("--stats", action="store_true",
+                        help="for a results file, write a JSON record per puzzle with its status and solve time")
+    args = parser.parse_args(argv)
+    if args.command == "pack":
+        puzzles = SudokuIO.readPuzzles(args.input)
+        first = next(puzzles, None)
+        if first is None:
+            return writeStore(args.store, [], packed=not args.bytes)
+        import itertools
+        return writeStore(args.store, itertools.chain([first], puzzles), boxSizeFor(len(first)), not args.bytes)
+    if args.command == "solve":
+        return solveRange(args.store, args.results, args.start, args.stop, args.workers, args.chunksize,
+                          args.timeout, args.checkpoint_every)
+    store = PuzzleStore(args.store)
+    try:
+        if store.results and args.stats:
+            file = SudokuIO.openText(args.output, "w")
+            try:
+                for index in range(len(store)):
+                    status, micros = store.stats(index)
+                    file.write(json.dumps({"status": STATUS_NAMES[status], "microseconds": micros,
+                                           "solution": store.puzzle(index) if status == SOLVED else None}) + "\n")
+                return len(store)
+            finally:
+                if file is sys.stdout:
+                    file.flush()
+                else:
+                    file.close()
+        if store.results:
+            # A results file gives its solutions, with the unsolved marker for the rest.
+            items = (store.puzzle(index) if store.stats(index)[0] == SOLVED else None for index in range(len(store)))
+        else:
+            items = (store.puzzle(index) for index in range(len(store)))
+        return SudokuIO.writePuzzles(items, args.output, args.output_format)
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
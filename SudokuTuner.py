@@ -0,0 +1,122 @@
+# Joe Shymanski
+# Sudoku Solver - technique order tuner
+# Times deductiveSolve on a corpus under every fixed order, and optionally under random permutations of the techniques
+# that follow the singles, then writes an OrderProfile naming the fastest order for each tier of puzzles. The profile
+# is what deductiveSolve(order="auto") loads. Timing runs in parallel, one chunk of puzzles under one order per task.
+import json
+import random
+import sys
+import time
+from SudokuSolver import Table, OrderProfile, DEFAULT_PROFILE, iterChunks, orderedMap
+
+FIXED_ORDERS = list(range(1, 19))
+
+
+def candidateOrders(samples=0, seed=0):
+    # The fixed orders, then `samples` random permutations of techniques 3 to 14 behind the two singles.
+    orders = list(FIXED_ORDERS)
+    rng = random.Random(seed)
+    for _ in range(samples):
+        orders.append([1, 2] + rng.sample(range(3, 15), 12))
+    return orders
+
+
+def timeChunk(puzzles, order, repeat=1):
+    # Seconds each puzzle took under order, the best of repeat runs.
+    times = []
+    for puzzle in puzzles:
+        best = None
+        for _ in range(repeat):
+            table = Table.fromString(puzzle)
+            start = time.perf_counter_ns()
+            table.deductiveSolve(False, order)
+            elapsed = time.perf_counter_ns() - start
+            if best is None or elapsed < best:
+                best = elapsed
+        times.append(best / 1e9)
+    return times
+
+
+def quantileBounds(values, bins):
+    # Cut points that split values into bins of about equal size; equal cut points are merged.
+    ordered = sorted(values)
+    bounds = []
+    for k in range(1, bins):
+        bound = ordered[len(ordered) * k // bins]
+        if not bounds or bound > bounds[-1]:
+            bounds.append(bound)
+    return bounds
+
+
+def tune(corpus, orders, workers=None, chunksize=16, repeat=1, bins=3):
+    # corpus maps tier names to puzzles. Returns the profile and a report of the total seconds under each order, for
+    # each corpus tier and each feature tier.
+    names = [name for name, puzzles in corpus.items() for _ in puzzles]
+    puzzles = [puzzle for tierPuzzles in corpus.values() for puzzle in tierPuzzles]
+    features = [OrderProfile.features(Table.fromString(puzzle)) for puzzle in puzzles]
+    profile = OrderProfile(quantileBounds([clues for clues, _ in features], bins),
+                           quantileBounds([candidates for _, candidates in features], bins))
+    tiers = [profile.tier(clues, candidates) for clues, candidates in features]
+    chunks = list(iterChunks(range(len(puzzles)), chunksize))
+    tasks = [(o, chunk) for o in range(len(orders)) for chunk in chunks]
+    results = orderedMap(timeChunk, (([puzzles[i] for i in chunk], orders[o], repeat) for o, chunk in tasks), workers)
+    report = {"orders": orders, "corpusTiers": {}, "featureTiers": {}}
+    for name in corpus:
+        report["corpusTiers"][name] = [0.0] * len(orders)
+    for tier in sorted(set(tiers)):
+        report["featureTiers"][tier] = {"puzzles": tiers.count(tier), "seconds": [0.0] * len(orders)}
+    total = [0.0] * len(orders)
+    for (o, chunk), times in zip(tasks, results):
+        for i, seconds in zip(chunk, times):
+            report["corpusTiers"][names[i]][o] += seconds
+            report["featureTiers"][tiers[i]]["seconds"][o] += seconds
+            total[o] += seconds
+    for tier, stats in report["featureTiers"].items():
+        profile.orders[tier] = orders[min(range(len(orders)), key=stats["seconds"].__getitem__)]
+    profile.default = orders[min(range(len(orders)), key=total.__getitem__)]
+    return profile, report
+
+
+def printReport(profile, report):
+    orders = report["orders"]
+    for label, key in (("Corpus tier", "corpusTiers"), ("Feature tier", "featureTiers")):
+        for tier, stats in report[key].items():
+            seconds = stats["seconds"] if key == "featureTiers" else stats
+            best = min(range(len(orders)), key=seconds.__getitem__)
+            print("%-12s %-8s fastest order %-40s %9.3f s  (order 1: %9.3f s)" % (
+                label, tier, json.dumps(orders[best]), seconds[best], seconds[0]))
+    print("Default order", json.dumps(profile.default))
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Sudoku Solver technique order tuner")
+    parser.add_argument("corpus", nargs="*", help="puzzle files, one tier each (default: the benchmark corpus)")
+    parser.add_argument("--count", type=int, default=50, help="puzzles per generated tier of the benchmark corpus")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the benchmark corpus and sampled orders")
+    parser.add_argument("--table", default="SudokuTable.txt", help="puzzle file for the table tier of the corpus")
+    parser.add_argument("--samples", type=int, default=0, help="random technique permutations to try as well")
+    parser.add_argument("--workers", type=int, help="worker processes (default: all cores)")
+    parser.add_argument("--chunksize", type=int, default=16, help="puzzles per task sent to a worker")
+    parser.add_argument("--repeat", type=int, default=1, help="times to solve each puzzle, keeping the fastest")
+    parser.add_argument("--bins", type=int, default=3, help="tiers per feature")
+    parser.add_argument("--out", default=DEFAULT_PROFILE, help="where to write the profile")
+    args = parser.parse_args(argv)
+    if args.corpus:
+        import SudokuIO
+        corpus = {path: list(SudokuIO.readPuzzles(path)) for path in args.corpus}
+    else:
+        import SudokuBenchmark
+        corpus = SudokuBenchmark.buildCorpus(args.count, args.seed, args.table)
+    orders = candidateOrders(args.samples, args.seed)
+    profile, report = tune(corpus, orders, args.workers, args.chunksize, args.repeat, args.bins)
+    printReport(profile, report)
+    data = profile.asDict()
+    data["report"] = report
+    with open(args.out, "w") as file:
+        json.dump(data, file, indent=1)
+    return profile
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
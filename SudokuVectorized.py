@@ -0,0 +1,107 @@
+# Joe Shymanski
+# Sudoku Solver - NumPy batch backend
+# Runs peer elimination, naked singles and hidden singles over many boards at once. Boards that are not solved by
+# these sweeps drop out to the scalar exact cover search with the candidates the sweeps already removed.
+import numpy as np
+from array import array
+from SudokuSolver import Table, STANDARD, timeBudget
+
+ALL_CANDIDATES = STANDARD.allCandidates
+UNIT_CELLS = np.array(STANDARD.units, dtype=np.intp)           # (27, 9)
+CELL_UNIT_IDS = np.array(STANDARD.cellUnits, dtype=np.intp)    # (81, 3)
+DIGIT_BITS = (1 << np.arange(9)).astype(np.uint16)             # (9,)
+POPCOUNT_TABLE = np.frombuffer(STANDARD.popcount, dtype=np.uint8)
+VALUE_BITS = np.concatenate(([0], DIGIT_BITS)).astype(np.uint16)
+SYMBOL_TABLE = np.frombuffer(STANDARD.symbolValues, dtype=np.uint8)
+
+
+def parseBatch(puzzles):
+    # (N, 81) uint8 values and uint16 candidate masks from 81-character str or bytes puzzles.
+    data = b"".join(p.encode("ascii") if isinstance(p, str) else bytes(p) for p in puzzles)
+    values = SYMBOL_TABLE[np.frombuffer(data, dtype=np.uint8).reshape(-1, 81)]
+    masks = np.where(values > 0, VALUE_BITS[values], np.uint16(ALL_CANDIDATES)).astype(np.uint16)
+    return values, masks
+
+
+def unitBits(values):
+    # (N, 27) OR of the placed digits' bits in each unit.
+    return np.bitwise_or.reduce(VALUE_BITS[values][:, UNIT_CELLS], axis=2)
+
+
+def sweep(values, masks):
+    # One round of peer elimination, naked singles and hidden singles on every board; changes values and masks in
+    # place and returns a boolean array of the boards that changed.
+    before = masks.copy()
+    empty = values == 0
+    placed = unitBits(values)
+    peerBits = placed[:, CELL_UNIT_IDS[:, 0]] | placed[:, CELL_UNIT_IDS[:, 1]] | placed[:, CELL_UNIT_IDS[:, 2]]
+    masks &= np.where(empty, ~peerBits, np.uint16(0xFFFF))
+
+    nakedSingles = empty & (POPCOUNT_TABLE[masks] == 1)
+    values[nakedSingles] = np.log2(masks[nakedSingles]).astype(np.uint8) + 1
+
+    # Digits placed by this round's naked singles have not been struck from their peers yet, so they are excluded
+    # explicitly rather than being mistaken for hidden singles.
+    empty = values == 0
+    placed = (unitBits(values)[:, :, None] & DIGIT_BITS) != 0                      # (N, 27, 9)
+    candidates = ((masks[:, :, None] & DIGIT_BITS) != 0) & empty[:, :, None]    # (N, 81, 9)
+    inUnits = candidates[:, UNIT_CELLS, :]                                          # (N, 27, 9, 9)
+    counts = inUnits.sum(axis=2)                                                    # (N, 27, 9)
+    boards, units, digits = np.nonzero((counts == 1) & ~placed)
+    if len(boards):
+        positions = inUnits[boards, units, :, digits].argmax(axis=1)
+        cells = UNIT_CELLS[units, positions]
+        values[boards, cells] = digits + 1
+
+    filled = values > 0
+    masks[filled] = VALUE_BITS[values[filled]]
+    return (masks != before).any(axis=1)
+
+
+def isSolved(values):
+    return (values > 0).all(axis=1) & (unitBits(values) == ALL_CANDIDATES).all(axis=1)
+
+
+def propagateBatch(values, masks, maxSweeps=81):
+    # Sweeps the boards still making progress until each one is solved or stalls.
+    active = np.arange(len(values))
+    for _ in range(maxSweeps):
+        if not len(active):
+            break
+        subValues = values[active]
+        subMasks = masks[active]
+        changed = sweep(subValues, subMasks)
+        values[active] = subValues
+        masks[active] = subMasks
+        unfinished = (subValues == 0).any(axis=1)
+        active = active[changed & unfinished]
+    return values, masks
+
+
+def formatBoard(row):
+    return "".join(str(value) if value else "." for value in row.tolist())
+
+
+def solveBatch(puzzles, timeout=None, until=None):
+    # Solutions in input order, or None for puzzles with no solution or that ran out of time in the scalar search.
+    # until is a wall-clock deadline for the whole batch, as in solveChunk.
+    puzzles = list(puzzles)
+    if not puzzles:
+        return []
+    values, masks = parseBatch(puzzles)
+    propagateBatch(values, masks)
+    solved = isSolved(values)
+    results = []
+    for n in range(len(puzzles)):
+        if solved[n]:
+            results.append(formatBoard(values[n]))
+            continue
+        # Every sweep deduction is forced, so the swept state has the same solutions as the puzzle.
+        table = Table.fromString(puzzles[n])
+        table.setState(values[n].tolist(), array("H", masks[n].tolist()))
+        budget = timeBudget(timeout, until)
+        if budget != 0 and table.bruteForceSolve(False, timeout=budget):
+            results.append(table.toString())
+        else:
+            results.append(None)
+    return results